@@ -0,0 +1,218 @@
+"""
+This module keeps the per-date analytics of the application in a single columnar store: an Arrow
+IPC file with one row per date holding the NDVI table columns, the histogram counts and the
+histogram bin edges, sorted by date. Each row also records the modification time of the mosaics
+it was computed from, so an update only recomputes the dates whose mosaics changed and merges
+them in with upsert.
+
+The file is written uncompressed, so open_store can memory-map it: the columns are numpy views
+of the mapped pages rather than parsed copies, and the histogram of a date is read from the map
+only when it is looked up. Lookups go through a date index built once at open, in constant time
+whatever the number of dates.
+
+It only depends on pyarrow, numpy and pandas, so the application can open the store without loading
+the raster stack (rasterio) used by ndvi_stats to build it.
+"""
+
+import os
+import pickle
+from datetime import date as dt_date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Default location of the store, next to the application
+STORE_FILE = "ndvi_analytics.arrow"
+
+# One row per date: the NDVI table columns (ndvi_stats.COLUMNS) and the histogram
+SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("total_pixels", pa.int64()),
+    ("veg_pixels", pa.int64()),
+    ("masked_pixels", pa.int64()),
+    ("cloud_cover_pct", pa.float64()),
+    ("veg_abundance_pct", pa.float64()),
+    ("avg_ndvi", pa.float64()),
+    ("median_ndvi", pa.float64()),
+    ("std_ndvi", pa.float64()),
+    ("var_coeff_ndvi", pa.float64()),
+    ("hist_counts", pa.list_(pa.int64())),
+    ("hist_bins", pa.list_(pa.float64())),
+    ("source_mtime", pa.float64()),
+])
+
+
+def summaries_to_table(summaries):
+    """
+    Builds the store's table from per-date summaries, sorted by date.
+
+    Parameters:
+    summaries (list): (date, summary) pairs, with the date as YYYY-MM-DD and the summary
+        as returned by ndvi_stats.read_summary, including the "source_mtime" of its mosaics.
+
+    Returns:
+    pyarrow.Table: One row per date, following SCHEMA.
+    """
+    rows = []
+    for date, summary in sorted(summaries, key=lambda item: item[0]):
+        rows.append({
+            "date": dt_date.fromisoformat(date),
+            **{key: np.asarray(value).item() for key, value in summary["stats"].items()},
+            "hist_counts": np.asarray(summary["histogram"]["counts"]).tolist(),
+            "hist_bins": np.asarray(summary["histogram"]["bins"]).tolist(),
+            "source_mtime": summary["source_mtime"],
+        })
+    return pa.Table.from_pylist(rows, schema=SCHEMA)
+
+
+def write_store(table, store_path=STORE_FILE):
+    """
+    Writes the table to store_path as one uncompressed Arrow IPC record batch. The file is
+    replaced atomically, so an application reading the old store is never left with a
+    half-written file.
+    """
+    table = table.combine_chunks()
+    with pa.OSFile(f"{store_path}.tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    os.replace(f"{store_path}.tmp", store_path)
+    return store_path
+
+
+def _column(table, name):
+    # The store is written as one record batch, so a column is a single array viewing the map
+    column = table.column(name)
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def open_store(store_path=STORE_FILE):
+    """
+    Opens the store memory-mapped and indexes its rows by date. Every column is kept as a
+    numpy view of the mapped file, and each histogram column as its flat values and the
+    offsets of each row, so a lookup only indexes arrays.
+
+    Parameters:
+    store_path (str, optional): Path of the store. Defaults to STORE_FILE.
+
+    Returns:
+    dict: "table", the memory-mapped pyarrow.Table, "columns", the numpy view of every
+        column, and "index", the row of each date as YYYY-MM-DD.
+    """
+    table = pa.ipc.open_file(pa.memory_map(store_path)).read_all()
+    columns = {}
+    for name in table.column_names:
+        array = _column(table, name)
+        if pa.types.is_list(array.type):
+            columns[name] = (array.values.to_numpy(), array.offsets.to_numpy())
+        else:
+            columns[name] = array.to_numpy(zero_copy_only=False)
+    dates = columns["date"].astype(str).tolist()
+    return {"table": table, "columns": columns,
+            "index": {date: row for row, date in enumerate(dates)}}
+
+
+def lookup(store, date):
+    """
+    Returns the row of a date as a dict, with the histogram counts and bin edges as numpy
+    arrays, or None if the date is not in the store.
+
+    Parameters:
+    store (dict): A store from open_store.
+    date (str): The date as YYYY-MM-DD.
+    """
+    row = store["index"].get(date)
+    if row is None:
+        return None
+    record = {}
+    for name, column in store["columns"].items():
+        if isinstance(column, tuple):
+            values, offsets = column
+            record[name] = values[offsets[row]:offsets[row + 1]]
+        else:
+            record[name] = column[row].item()
+    return record
+
+
+def source_mtimes(store):
+    """
+    Returns the modification time of the mosaics each date of the store was computed from,
+    by date as YYYY-MM-DD.
+    """
+    mtimes = store["columns"]["source_mtime"]
+    return {date: mtimes[row].item() for date, row in store["index"].items()}
+
+
+def upsert(table, updates):
+    """
+    Merges updates into table in one batch, keyed by date: the rows of dates in updates
+    replace the existing ones and new dates are added.
+
+    Parameters:
+    table (pyarrow.Table): The current rows, following SCHEMA.
+    updates (pyarrow.Table): The new or recomputed rows, following SCHEMA.
+
+    Returns:
+    pyarrow.Table: The merged rows, sorted by date.
+    """
+    keep = pc.invert(pc.is_in(table.column("date"), value_set=updates.column("date")))
+    return pa.concat_tables([table.filter(keep), updates]).sort_by("date")
+
+
+def histogram_data(store, date):
+    """
+    Returns the histogram of a date in the format used by the application's histogram plot:
+    counts, bins, median, mean and date ("Month-DD"), or None if the date is not in the store.
+    """
+    record = lookup(store, date)
+    if record is None:
+        return None
+    return {
+        'counts': record["hist_counts"],
+        'bins': record["hist_bins"],
+        'median': record["median_ndvi"],
+        'mean': record["avg_ndvi"],
+        'date': record["date"].strftime("%B-%d"),
+    }
+
+
+def summary_dataframe(store):
+    """
+    Returns the NDVI table of the store (every column but the histogram and source_mtime)
+    as a pandas DataFrame, with the date column as datetime64.
+    """
+    table = store["table"].drop_columns(["hist_counts", "hist_bins", "source_mtime"])
+    return table.to_pandas(date_as_object=False)
+
+
+def store_from_legacy(csv_path, base_dir, store_path=STORE_FILE):
+    """
+    Builds the store from the files it replaces, the ndvi_data.csv table and the
+    {base_dir}/{month}/{day}_hist.pkl histogram pickles, without reading the rasters again.
+    Dates without a pickle are skipped. The pickle's modification time stands for the time
+    of the mosaics, so only dates whose mosaics changed after it are recomputed later.
+
+    Parameters:
+    csv_path (str): Path of the NDVI table.
+    base_dir (str): The directory holding the month folders of the historic rasters.
+    store_path (str, optional): Where the store is saved. Defaults to STORE_FILE.
+
+    Returns:
+    int: The number of dates saved to the store.
+    """
+    summaries = []
+    for row in pd.read_csv(csv_path, parse_dates=["date"]).to_dict("records"):
+        date = row.pop("date")
+        pickle_path = f"{base_dir}/{date.strftime('%B')}/{date.strftime('%d')}_hist.pkl"
+        if not os.path.exists(pickle_path):
+            print(f"No histogram for {date:%Y-%m-%d}, skipped")
+            continue
+        with open(pickle_path, 'rb') as f:
+            histogram = pickle.load(f)
+        summaries.append((date.strftime("%Y-%m-%d"),
+                          {"stats": row, "histogram": {"counts": histogram['counts'],
+                                                       "bins": histogram['bins']},
+                           "source_mtime": os.path.getmtime(pickle_path)}))
+    write_store(summaries_to_table(summaries), store_path)
+    return len(summaries)
@@ -1,7 +1,7 @@
+import base64
 import os
 import requests
 import numpy as np
-import pickle
 
 from shiny.express import input, render, ui
 from shiny import reactive
@@ -13,15 +13,21 @@ from scipy.signal import savgol_filter
 import pandas as pd
 from shinyswatch import theme
 
+from analytics_store import summary_dataframe
+from histogram_cache import get_store, histogram_png
+
 
 # Base directory for your data (same as in TiTiler server)
 BASE_DIR = '/Volumes/Drew_ext_drive/NDVI_Proj/historic_rasters/2024'
 
+# Analytics store built by ndvi_dataframe_builder.py
+ANALYTICS_STORE = '/Users/drewengellant/Documents/MSBA/Spring25/capstone/satellite-to-NDVI/ndvi_analytics.arrow'
+
+# The store is opened memory-mapped once per process and shared by every session
+analytics, _ = get_store(ANALYTICS_STORE)
+
 # Load the NDVI data
-ndvi_summary_df = pd.read_csv(
-    '/Users/drewengellant/Documents/MSBA/Spring25/capstone/satellite-to-NDVI/ndvi_data.csv')
-ndvi_summary_df['date'] = pd.to_datetime(
-    ndvi_summary_df['date'])    # Convert date column to datetime
+ndvi_summary_df = summary_dataframe(analytics)
 
 img_src = 'https://dailynewsnetwork.com/wp-content/uploads/2024/11/Morton-Primary-Stacked-Full-Color.png'
 
@@ -111,8 +117,8 @@ with ui.navset_card_tab():
                         f"http://localhost:8000/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}.png?"
                         f"url=file://{BASE_DIR}/{month}/{day}/NDVI_mosaic.tif"
                         f"&colormap_name=rdylgn"
+                        f"&unscale=true"
                         f"&rescale=0.01,1"
-                        f"&nodata=nan"
                         f"&return_mask=true"
                     )
 
@@ -174,57 +180,21 @@ with ui.navset_card_tab():
                 )
             with ui.layout_columns(col_widths=(5, 7)):
                 with ui.card(height="300px"):
-                    @render.plot(alt="NDVI histogram")
+                    @render.ui
                     def plot_hist():
                         month = input.analysis_month_select()
                         day = input.analysis_day_select()
 
                         # Check for valid inputs
-                        if not month or not day or day == "None":
-                            # Return an empty plot if inputs are invalid
-                            fig, ax = plt.subplots()
-                            ax.text(0.5, 0.5, "Select a valid date to display data",
-                                    ha='center', va='center', transform=ax.transAxes)
-                            ax.set_axis_off()
-                            return fig
-                        # Construct the path to the pickle file
-                        pickle_path = f"{BASE_DIR}/{month}/{day}_hist.pkl"
-
-                        # Load the histogram data from the pickle file
-                        with open(pickle_path, 'rb') as f:
-                            histogram_data = pickle.load(f)
-
-                        # Create the histogram using the pre-computed data
-                        fig, ax = plt.subplots()
-
-                        # Plot histogram using the saved bin counts and edges
-                        ax.bar(histogram_data['bins'][:-1],
-                               histogram_data['counts'],
-                               width=np.diff(histogram_data['bins']),
-                               alpha=0.5,
-                               color='#6053E4',
-                               label='NDVI Values')
-
-                        ax.set_title(
-                            'Distribution of Vegetation Index (NDVI) Values')
-                        ax.set_xlabel('NDVI Value')
-                        ax.set_ylabel('Abundance')
-                        ax.set_ylim(0, 8000000)  # Set y-axis limits
-
-                        # Remove the box around the plot
-                        ax.spines['top'].set_visible(False)
-                        ax.spines['right'].set_visible(False)
-                        ax.spines['left'].set_visible(False)
-                        ax.spines['bottom'].set_visible(False)
-
-                        # Plot the median line using the saved median value
-                        median_ndvi = histogram_data['median']
-                        ax.axvline(x=median_ndvi, color='red', linestyle='-',
-                                   label=f'Median: {median_ndvi:.2f}')
-                        # Increase handle length to make space for the Median: legend
-                        ax.legend(loc='upper left')
-
-                        return fig
+                        date_str = None
+                        if month and day and day != "None":
+                            date_str = pd.to_datetime(f"2024-{month}-{day}").strftime("%Y-%m-%d")
+
+                        # The rendered histogram is cached for every session (see histogram_cache);
+                        # render.image only serves files, so the PNG is inlined as a data URI
+                        png = histogram_png(ANALYTICS_STORE, date_str, histogram_figure)
+                        return ui.tags.img(src=f"data:image/png;base64,{base64.b64encode(png).decode()}",
+                                           width="100%", alt="NDVI histogram")
 
                         # Right column: Timeseries plot
                 with ui.layout_columns(col_widths=(12)):
@@ -683,6 +653,49 @@ with ui.navset_card_tab():
                 """, style="font-style: italic;")
 
 
+# Function to draw the NDVI histogram of a date from its histogram data
+def histogram_figure(hist_data):
+    # Check for valid inputs
+    if hist_data is None:
+        # Return an empty plot if inputs are invalid
+        fig, ax = plt.subplots()
+        ax.text(0.5, 0.5, "Select a valid date to display data",
+                ha='center', va='center', transform=ax.transAxes)
+        ax.set_axis_off()
+        return fig
+
+    # Create the histogram using the pre-computed data
+    fig, ax = plt.subplots()
+
+    # Plot histogram using the saved bin counts and edges
+    ax.bar(hist_data['bins'][:-1],
+           hist_data['counts'],
+           width=np.diff(hist_data['bins']),
+           alpha=0.5,
+           color='#6053E4',
+           label='NDVI Values')
+
+    ax.set_title(
+        'Distribution of Vegetation Index (NDVI) Values')
+    ax.set_xlabel('NDVI Value')
+    ax.set_ylabel('Abundance')
+    ax.set_ylim(0, 8000000)  # Set y-axis limits
+
+    # Remove the box around the plot
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['left'].set_visible(False)
+    ax.spines['bottom'].set_visible(False)
+
+    # Plot the median line using the saved median value
+    median_ndvi = hist_data['median']
+    ax.axvline(x=median_ndvi, color='red', linestyle='-',
+               label=f'Median: {median_ndvi:.2f}')
+    # Increase handle length to make space for the Median: legend
+    ax.legend(loc='upper left')
+
+    return fig
+
 # Function to get available days from the server
 def get_available_days(month):
     try:
@@ -0,0 +1,619 @@
+"""
+This script contains micro-benchmarks for the performance-sensitive parts of the pipeline in main.py.
+Each benchmark builds synthetic rasters, so no Sentinel-2 downloads or external drive are needed.
+
+Usage:
+    python benchmarks.py            # run every benchmark
+    python benchmarks.py ndvi       # run a single benchmark
+"""
+
+import io
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import geopandas as gpd
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import rasterio
+import rioxarray
+import xarray as xr
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+import analytics_store
+import histogram_cache
+import main
+import ndvi_stats
+import upload_to_DO
+
+
+def time_call(func, *args, repeats=5):
+    """
+    Runs func(*args) repeats times and returns the best wall-clock time in seconds.
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# ------------------------------------------------------------------------------
+# NDVI kernel
+# ------------------------------------------------------------------------------
+def legacy_compute_ndvi(red_band_masked, nir_band_masked):
+    """
+    The three-pass compute_ndvi that main.py used before the fused kernel, kept as a baseline.
+    """
+    numerator = nir_band_masked - red_band_masked
+    denominator = nir_band_masked + red_band_masked
+    ndvi = xr.where(denominator == 0, np.nan, numerator / denominator)
+    ndvi = np.where(ndvi == 0, np.nan, ndvi)
+    ndvi = xr.where(np.isnan(red_band_masked) | np.isnan(nir_band_masked),
+                    np.nan, ndvi)
+    return ndvi.rio.write_crs(red_band_masked.rio.crs)
+
+
+def synthetic_bands(size, nan_fraction=0.4, seed=0):
+    """
+    Builds masked Red and NIR bands like the ones produced by clip_and_mask_bands.
+    """
+    rng = np.random.default_rng(seed)
+    coords = {"band": [1], "y": np.arange(size)[::-1] * 10.0,
+              "x": np.arange(size) * 10.0}
+    bands = []
+    for low, high in [(200, 3000), (1000, 6000)]:
+        values = rng.integers(low, high, (1, size, size)).astype("float32")
+        values[rng.random((1, size, size)) < nan_fraction] = np.nan
+        band = xr.DataArray(values, coords=coords, dims=("band", "y", "x"))
+        bands.append(band.rio.write_crs("EPSG:32611"))
+    return bands
+
+
+def benchmark_ndvi(size=4096, repeats=5):
+    """
+    Compares the fused normalized_difference kernel in compute_ndvi against the
+    legacy three-pass implementation, both in memory and on dask chunks.
+    """
+    red, nir = synthetic_bands(size)
+
+    legacy = legacy_compute_ndvi(red, nir)
+    fused = main.compute_ndvi(red, nir)
+    assert np.allclose(np.asarray(legacy), fused.values, equal_nan=True)
+
+    print(f"NDVI on {size}x{size} pixels (best of {repeats}):")
+    legacy_time = time_call(legacy_compute_ndvi, red, nir, repeats=repeats)
+    fused_time = time_call(main.compute_ndvi, red, nir, repeats=repeats)
+    print(f"  in memory: legacy {legacy_time:.3f}s, fused {fused_time:.3f}s "
+          f"({legacy_time / fused_time:.1f}x)")
+
+    red_chunked = red.chunk({"x": 1024, "y": 1024})
+    nir_chunked = nir.chunk({"x": 1024, "y": 1024})
+    legacy_time = time_call(
+        lambda: np.asarray(legacy_compute_ndvi(red_chunked, nir_chunked)), repeats=repeats)
+    fused_time = time_call(
+        lambda: main.compute_ndvi(red_chunked, nir_chunked).compute(), repeats=repeats)
+    print(f"  dask chunks: legacy {legacy_time:.3f}s, fused {fused_time:.3f}s "
+          f"({legacy_time / fused_time:.1f}x)")
+
+
+# ------------------------------------------------------------------------------
+# COG writing
+# ------------------------------------------------------------------------------
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files with support for single HTTP Range requests, like an object store,
+    and counts the requests made for each file.
+    latency is added to every request, to stand in for a remote object store.
+    """
+    counts = {}
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        self.counts[self.path] = self.counts.get(self.path, 0) + 1
+        if "Range" not in self.headers or not os.path.isfile(path):
+            return super().do_GET()
+
+        size = os.path.getsize(path)
+        start, end = self.headers["Range"].removeprefix("bytes=").split("-")
+        start, end = int(start), min(int(end or size - 1), size - 1)
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def synthetic_mosaic(path, size, seed=0):
+    """
+    Writes a float32 NDVI-like mosaic with NaN outside a disc, like the ones written by
+    write_streaming_mosaic before overviews are added.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[:size, :size]
+    values = rng.normal(0.5, 0.2, (size, size)).astype("float32")
+    values[(x - size / 2) ** 2 + (y - size / 2) ** 2 > (size / 2) ** 2] = np.nan
+    profile = dict(main.GTIFF_OPTIONS, width=size, height=size, count=1, dtype="float32",
+                   crs="EPSG:3857", transform=from_origin(-13300000, 5900000, 10, 10),
+                   nodata=np.nan)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(values, 1)
+
+
+def write_two_step(src_path, dst_path):
+    """
+    The GTiff + add_overviews path that build_date_products used before COG output.
+    """
+    shutil.copy(src_path, dst_path)
+    main.add_overviews(dst_path)
+
+
+def write_one_pass(src_path, dst_path):
+    """
+    The one-pass COG copy done by cog_output.
+    """
+    rasterio.shutil.copy(src_path, dst_path, **main.COG_OPTIONS)
+
+
+def count_tile_requests(url, overview_level=None):
+    """
+    Opens url over HTTP like a tile server would and reads one 256x256 tile from its centre,
+    from the full resolution or from an overview. Returns the number of HTTP requests made.
+    """
+    RangeRequestHandler.counts.clear()
+    with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN="EMPTY_DIR", VSI_CACHE=False,
+                      CPL_VSIL_CURL_NON_CACHED=f"/vsicurl/{url}"):
+        with rasterio.open(f"/vsicurl/{url}", overview_level=overview_level) as src:
+            window = rasterio.windows.Window(src.width // 2, src.height // 2, 256, 256)
+            src.read(1, window=window)
+    return sum(RangeRequestHandler.counts.values())
+
+
+def benchmark_cog(size=8192, repeats=3):
+    """
+    Compares writing a mosaic as a COG in one pass against writing a GTiff and appending
+    overviews with add_overviews: write time, file size, and the number of HTTP range
+    requests a tile server needs to serve one tile from the full resolution and from an overview.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        source = f"{tmp}/source.tif"
+        synthetic_mosaic(source, size)
+
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(RangeRequestHandler, directory=tmp))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        print(f"Mosaic of {size}x{size} pixels (best of {repeats}):")
+        try:
+            for name, writer in [("GTiff + add_overviews", write_two_step),
+                                 ("one-pass COG", write_one_pass)]:
+                output = f"{tmp}/{writer.__name__}.tif"
+                write_time = time_call(
+                    lambda: (os.path.exists(output) and os.remove(output),
+                             writer(source, output)), repeats=repeats)
+                url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(output)}"
+                full = count_tile_requests(url)
+                overview = count_tile_requests(url, overview_level=2)
+                print(f"  {name}: write {write_time:.2f}s, "
+                      f"{os.path.getsize(output) / 2**20:.1f} MiB, "
+                      f"{full} requests per full-resolution tile, "
+                      f"{overview} per overview tile")
+        finally:
+            server.shutdown()
+
+
+# ------------------------------------------------------------------------------
+# Concurrent remote reads
+# ------------------------------------------------------------------------------
+def benchmark_remote_reads(n_scenes=8, size=2048, workers=4, latency=0.15):
+    """
+    Clips n_scenes remote bands with main.clip_band on 1 and on workers threads, as
+    process_scenes does, from an HTTP server adding latency seconds to every range request.
+    Compares the dataset handle per thread of clip_band (lock=False) with rioxarray's default
+    process-wide lock, under which the threads' reads run one at a time.
+    """
+    rng = np.random.default_rng(0)
+    clip = gpd.GeoDataFrame(geometry=[box(301000, 5181000, 318000, 5198000)], crs="EPSG:32611")
+    open_rasterio = rioxarray.open_rasterio
+
+    def default_lock(*args, lock=None, **kwargs):
+        return open_rasterio(*args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(n_scenes):
+            with rasterio.open(f"{tmp}/band_{i}.tif", "w", driver="COG", width=size,
+                               height=size, count=1, dtype="uint16", crs="EPSG:32611",
+                               transform=from_origin(300000, 5200000, 10, 10), blocksize=512,
+                               compress="deflate") as dst:
+                dst.write(rng.integers(1, 5000, (size, size), dtype=np.uint16), 1)
+
+        handler = type("LatencyHandler", (RangeRequestHandler,), {"latency": latency})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=tmp))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls = [f"http://127.0.0.1:{server.server_port}/band_{i}.tif" for i in range(n_scenes)]
+
+        def clip_all(threads):
+            with ThreadPoolExecutor(threads) as executor:
+                list(executor.map(lambda url: main.clip_band(url, clip).compute(), urls))
+
+        print(f"Clipping {n_scenes} remote bands ({latency * 1e3:.0f} ms per request):")
+        try:
+            for name, opener in [("default lock", default_lock),
+                                 ("handle per thread", open_rasterio)]:
+                main.rioxarray.open_rasterio = opener
+                serial = time_call(clip_all, 1, repeats=1)
+                threaded = time_call(clip_all, workers, repeats=1)
+                print(f"  {name}: 1 thread {serial:.2f}s, {workers} threads {threaded:.2f}s "
+                      f"({serial / threaded:.2f}x)")
+        finally:
+            main.rioxarray.open_rasterio = open_rasterio
+            server.shutdown()
+
+
+# ------------------------------------------------------------------------------
+# Product uploads
+# ------------------------------------------------------------------------------
+def benchmark_uploads(sizes=(3, 40), bucket="ndvi-bucket"):
+    """
+    Uploads the products of a date with upload_to_DO.upload_products to an in-memory S3
+    bucket (moto), one file per size in MB, the largest ones in multipart transfers. Checks
+    that the first run uploads every file, that the second run skips them, that the ETags of
+    the objects match upload_to_DO.multipart_etag, that a changed file is uploaded again and
+    that a missing file fails without stopping the others. Needs moto (pip install moto).
+    """
+    from moto import mock_aws
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp, mock_aws():
+        paths = []
+        for i, size in enumerate(sizes):
+            paths.append(f"{tmp}/LAYER{i}_mosaic.tif")
+            with open(paths[-1], "wb") as f:
+                f.write(rng.bytes(size * upload_to_DO.MB))
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=bucket)
+
+        first = upload_to_DO.upload_products(client, bucket, paths, "2024-06-01")
+        assert [r["status"] for r in first] == ["uploaded"] * len(paths), first
+        for result in first:
+            etag = client.head_object(Bucket=bucket, Key=result["key"])["ETag"].strip('"')
+            assert etag == upload_to_DO.multipart_etag(result["path"]), result["key"]
+
+        second = upload_to_DO.upload_products(client, bucket, paths, "2024-06-01")
+        assert [r["status"] for r in second] == ["skipped"] * len(paths), second
+
+        with open(paths[-1], "r+b") as f:
+            f.write(b"changed")
+        missing = f"{tmp}/MISSING_mosaic.tif"
+        third = upload_to_DO.upload_products(client, bucket, paths + [missing], "2024-06-01")
+        expected = ["skipped"] * (len(paths) - 1) + ["uploaded", "failed"]
+        assert [r["status"] for r in third] == expected, third
+
+        print(f"Uploading {len(paths)} products ({sum(sizes)} MB) to an in-memory bucket:")
+        print(f"  first run {sum(r['seconds'] for r in first):.2f}s uploading, "
+              f"second run {sum(r['seconds'] for r in second):.2f}s skipping")
+
+
+# ------------------------------------------------------------------------------
+# NDVI encoding
+# ------------------------------------------------------------------------------
+def synthetic_ndvi(size, seed=0):
+    """
+    Computes NDVI with compute_ndvi from spatially smooth Red and NIR reflectances plus sensor
+    noise, so that the rasters compress like real fields rather than white noise.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:size, :size] / size
+    field = np.sin(12 * x) * np.cos(9 * y) + np.sin(31 * x * y)
+    red, nir = synthetic_bands(size, nan_fraction=0.3, seed=seed)
+    red.values[0] = np.where(np.isnan(red.values[0]), np.nan,
+                             np.round(900 - 300 * field + rng.normal(0, 40, field.shape)))
+    nir.values[0] = np.where(np.isnan(nir.values[0]), np.nan,
+                             np.round(3000 + 900 * field + rng.normal(0, 60, field.shape)))
+    return main.compute_ndvi(red, nir).values[0]
+
+
+def write_ndvi(path, ndvi, encoding=None):
+    """
+    Writes ndvi with the mosaics' GTiff options, as float32 or with a scaled-integer encoding.
+    """
+    profile = dict(main.GTIFF_OPTIONS, width=ndvi.shape[1], height=ndvi.shape[0], count=1,
+                   dtype="float32", crs="EPSG:3857", nodata=np.nan,
+                   transform=from_origin(-13300000, 5900000, 10, 10))
+    if encoding is not None:
+        profile.update(dtype=encoding["dtype"], nodata=encoding["nodata"])
+    with rasterio.open(path, "w", **profile) as dst:
+        if encoding is not None:
+            dst.scales = (encoding["scale"],)
+            dst.offsets = (encoding["offset"],)
+            ndvi = main.encode_block(ndvi, encoding)
+        dst.write(ndvi, 1)
+
+
+def benchmark_ndvi_encoding(size=4096):
+    """
+    Compares NDVI stored as float32 against the NDVI_INT16 encoding: file size, and the
+    precision lost on the pixels and on the statistics and histograms the app shows.
+    """
+    ndvi = synthetic_ndvi(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_ndvi(f"{tmp}/float32.tif", ndvi)
+        write_ndvi(f"{tmp}/int16.tif", ndvi, main.NDVI_INT16)
+        sizes = {name: os.path.getsize(f"{tmp}/{name}.tif") for name in ("float32", "int16")}
+        with rasterio.open(f"{tmp}/int16.tif") as src:
+            decoded = src.read(1, masked=True).astype("float64")
+            decoded = (decoded * src.scales[0] + src.offsets[0]).filled(np.nan)
+
+    valid = ~np.isnan(ndvi)
+    assert np.array_equal(valid, ~np.isnan(decoded))
+    error = decoded[valid] - ndvi[valid]
+    hist_float, _ = np.histogram(ndvi[valid], bins=25, range=(0.2, 1))
+    hist_int, _ = np.histogram(decoded[valid], bins=25, range=(0.2, 1))
+
+    print(f"NDVI encoding on {size}x{size} pixels:")
+    print(f"  size: float32 {sizes['float32'] / 2**20:.1f} MiB, int16 "
+          f"{sizes['int16'] / 2**20:.1f} MiB ({sizes['int16'] / sizes['float32']:.0%})")
+    print(f"  pixel error: max {np.abs(error).max():.2e}, RMS {np.sqrt(np.mean(error ** 2)):.2e}")
+    print(f"  mean error {abs(decoded[valid].mean() - ndvi[valid].mean()):.2e}, "
+          f"median error {abs(np.median(decoded[valid]) - np.median(ndvi[valid])):.2e}, "
+          f"std error {abs(decoded[valid].std() - ndvi[valid].std()):.2e}")
+    print(f"  histogram pixels moved between the app's bins: "
+          f"{np.abs(hist_int - hist_float).sum() // 2} of {valid.sum()}")
+
+
+# ------------------------------------------------------------------------------
+# NDVI quantiles
+# ------------------------------------------------------------------------------
+def benchmark_quantiles(size=4096, block_size=1024, repeats=3):
+    """
+    Validates the quantile sketch of ndvi_stats against np.percentile and times it against
+    np.nanmedian on a full mosaic. Checks that:
+    - on float NDVI every percentile is within QUANTILE_STEP / 2 of the exact value,
+    - on NDVI decoded from NDVI_INT16 every percentile is exact,
+    - merging per-block sketches gives the sketch of the whole mosaic.
+    """
+    percentiles = [0, 0.1, 1, 5, 25, 50, 75, 95, 99, 99.9, 100]
+    ndvi = synthetic_ndvi(size).astype("float64")
+    encoding = main.NDVI_INT16
+    decoded = main.encode_block(ndvi, encoding).astype("float64")
+    decoded = np.where(decoded == encoding["nodata"], np.nan,
+                       decoded * encoding["scale"] + encoding["offset"])
+
+    print(f"Quantile sketch on {size}x{size} pixels:")
+    for name, values, bound in [("float NDVI", ndvi, ndvi_stats.QUANTILE_STEP / 2),
+                                ("int16 NDVI", decoded, 1e-9)]:
+        exact = np.nanpercentile(values, percentiles)
+        blocks = [ndvi_stats.sketch_block(values[row:row + block_size, col:col + block_size])
+                  for row in range(0, size, block_size) for col in range(0, size, block_size)]
+        sketch = ndvi_stats.merge_sketches(*blocks)
+        assert np.array_equal(sketch, ndvi_stats.sketch_block(values))
+        approx = ndvi_stats.sketch_quantiles(sketch, percentiles)
+        error = np.abs(np.array(approx) - exact).max()
+        assert error <= bound, f"{name}: error {error:.2e} above the bound {bound:.0e}"
+        print(f"  {name}: max error {error:.2e} over percentiles {percentiles} "
+              f"(bound {bound:.0e})")
+
+    nanmedian_time = time_call(np.nanmedian, ndvi, repeats=repeats)
+    sketch_time = time_call(
+        lambda: ndvi_stats.sketch_quantiles(ndvi_stats.sketch_block(ndvi), [50]), repeats=repeats)
+    print(f"  median: np.nanmedian {nanmedian_time:.3f}s, sketch {sketch_time:.3f}s "
+          f"({nanmedian_time / sketch_time:.1f}x), sketch memory "
+          f"{ndvi_stats.empty_sketch().nbytes / 1024:.0f} KiB")
+
+
+# ------------------------------------------------------------------------------
+# Analytics store
+# ------------------------------------------------------------------------------
+def synthetic_summaries(n_dates, seed=0):
+    """
+    Builds (date, summary) pairs like the ones produced by ndvi_stats.build_summaries,
+    for n_dates consecutive days.
+    """
+    rng = np.random.default_rng(seed)
+    bins = np.histogram_bin_edges([], bins=ndvi_stats.HIST_BINS, range=ndvi_stats.HIST_RANGE)
+    summaries = []
+    for i in range(n_dates):
+        stats = {column: float(rng.random()) for column in ndvi_stats.COLUMNS[1:]}
+        stats.update(total_pixels=int(rng.integers(1e8)), veg_pixels=int(rng.integers(1e8)),
+                     masked_pixels=int(rng.integers(1e8)))
+        counts = rng.integers(0, 8_000_000, ndvi_stats.HIST_BINS)
+        summaries.append(((date(2022, 1, 1) + timedelta(days=i)).isoformat(),
+                          {"stats": stats, "histogram": {"counts": counts, "bins": bins},
+                           "source_mtime": time.time()}))
+    return summaries
+
+
+def cold_start(code, repeats):
+    """
+    Returns the best time in seconds of running code in a fresh interpreter, minus the
+    interpreter's own start-up and imports.
+    """
+    imports = "import pickle, numpy, pandas, pyarrow, analytics_store, time; "
+    timed = f"start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+    runs = [float(subprocess.run([sys.executable, "-c", imports + timed], check=True,
+                                 capture_output=True, text=True, cwd=os.path.dirname(
+                                     os.path.abspath(__file__))).stdout)
+            for _ in range(repeats)]
+    return min(runs)
+
+
+def benchmark_analytics_store(n_dates=1095, lookups=1000, repeats=5):
+    """
+    Compares the analytics store against the per-day histogram pickles and ndvi_data.csv it
+    replaces, for n_dates dates (three years by default):
+    - cold start: loading the NDVI table in a fresh process (pd.read_csv vs open_store),
+    - lookup latency: the histogram data of a date (unpickling its file vs a store lookup).
+    Checks that both give the same histograms and table.
+    """
+    summaries = synthetic_summaries(n_dates)
+    tmp = tempfile.mkdtemp()
+    try:
+        # The pickles and CSV, as written by the analytics scripts before the store
+        rows = []
+        for date_str, summary in summaries:
+            with open(f"{tmp}/{date_str}_hist.pkl", "wb") as f:
+                pickle.dump({'counts': summary["histogram"]["counts"],
+                             'bins': summary["histogram"]["bins"],
+                             'median': summary["stats"]["median_ndvi"],
+                             'mean': summary["stats"]["avg_ndvi"], 'date': date_str}, f)
+            rows.append({"date": date_str, **summary["stats"]})
+        csv_path = f"{tmp}/ndvi_data.csv"
+        pd.DataFrame(rows, columns=ndvi_stats.COLUMNS).to_csv(csv_path, index=False)
+
+        store_path = analytics_store.write_store(
+            analytics_store.summaries_to_table(summaries), f"{tmp}/ndvi_analytics.arrow")
+        store = analytics_store.open_store(store_path)
+
+        csv_df = pd.read_csv(csv_path, parse_dates=["date"])
+        store_df = analytics_store.summary_dataframe(store)
+        pd.testing.assert_frame_equal(csv_df, store_df, check_dtype=False)
+
+        rng = np.random.default_rng(1)
+        dates = [summaries[i][0] for i in rng.integers(0, n_dates, lookups)]
+
+        def load_pickles():
+            for date_str in dates:
+                with open(f"{tmp}/{date_str}_hist.pkl", "rb") as f:
+                    pickle.load(f)
+
+        def load_store():
+            for date_str in dates:
+                analytics_store.histogram_data(store, date_str)
+
+        with open(f"{tmp}/{dates[0]}_hist.pkl", "rb") as f:
+            expected = pickle.load(f)
+        found = analytics_store.histogram_data(store, dates[0])
+        assert np.array_equal(expected["counts"], found["counts"])
+        assert np.array_equal(expected["bins"], found["bins"])
+
+        pickle_time = time_call(load_pickles, repeats=repeats) / lookups
+        store_time = time_call(load_store, repeats=repeats) / lookups
+        csv_start = cold_start(f"df = pandas.read_csv({csv_path!r}); "
+                               "df['date'] = pandas.to_datetime(df['date'])", repeats)
+        store_start = cold_start(f"store = analytics_store.open_store({store_path!r}); "
+                                 "df = analytics_store.summary_dataframe(store)", repeats)
+        store_size = os.path.getsize(store_path)
+        pickles_size = sum(os.path.getsize(f"{tmp}/{d}_hist.pkl") for d, _ in summaries)
+
+        print(f"Analytics of {n_dates} dates:")
+        print(f"  histogram lookup: pickle {pickle_time * 1e6:.0f} us, "
+              f"store {store_time * 1e6:.0f} us ({pickle_time / store_time:.1f}x)")
+        print(f"  cold start: csv {csv_start * 1e3:.1f} ms, store {store_start * 1e3:.1f} ms "
+              f"({csv_start / store_start:.1f}x)")
+        print(f"  on disk: {n_dates} pickles + csv {(pickles_size + os.path.getsize(csv_path)) / 1e6:.2f} MB, "
+              f"store {store_size / 1e6:.2f} MB in one file")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def histogram_figure(hist_data):
+    """
+    Draws a histogram like the Analytics tab of app.py.
+    """
+    fig, ax = plt.subplots()
+    if hist_data is not None:
+        ax.bar(hist_data['bins'][:-1], hist_data['counts'], width=np.diff(hist_data['bins']),
+               alpha=0.5, color='#6053E4', label='NDVI Values')
+        ax.axvline(x=hist_data['median'], color='red', label=f"Median: {hist_data['median']:.2f}")
+        ax.legend(loc='upper left')
+    return fig
+
+
+def benchmark_histogram_cache(n_dates=200, views=2000, max_entries=100):
+    """
+    Simulates analysts viewing the histograms of n_dates dates, 80% of the views going to
+    a fifth of the dates, through histogram_cache capped at max_entries entries, and compares
+    the time per view with rendering every view. Checks the hit and miss counters, the LRU
+    cap, and that updating the store invalidates its entries.
+    """
+    summaries = synthetic_summaries(n_dates)
+    tmp = tempfile.mkdtemp()
+    default_entries, histogram_cache.MAX_ENTRIES = histogram_cache.MAX_ENTRIES, max_entries
+    try:
+        store_path = analytics_store.write_store(
+            analytics_store.summaries_to_table(summaries), f"{tmp}/ndvi_analytics.arrow")
+        rng = np.random.default_rng(0)
+        popular = rng.random(views) < 0.8
+        rows = np.where(popular, rng.integers(0, n_dates // 5, views),
+                        rng.integers(0, n_dates, views))
+        dates = [summaries[row][0] for row in rows]
+
+        def render_all():
+            for date_str in dates[:100]:
+                store, _ = histogram_cache.get_store(store_path)
+                fig = histogram_figure(analytics_store.histogram_data(store, date_str))
+                fig.savefig(io.BytesIO(), format="png", dpi=100)
+                plt.close(fig)
+
+        histogram_cache.clear_cache()
+        start = time.perf_counter()
+        for date_str in dates:
+            histogram_cache.histogram_png(store_path, date_str, histogram_figure)
+        cached_time = (time.perf_counter() - start) / views
+        uncached_time = time_call(render_all, repeats=1) / 100
+
+        info = histogram_cache.cache_info()
+        png, payload = info["png"], info["payload"]
+        # Every view looks up its image once, and only an image miss looks up the date's data
+        assert png["hits"] + png["misses"] == views and png["misses"] < views
+        assert payload["hits"] + payload["misses"] == png["misses"]
+        assert png["entries"] + payload["entries"] <= max_entries
+        image = histogram_cache.histogram_png(store_path, dates[-1], histogram_figure)
+        assert image.startswith(b"\x89PNG")
+
+        # Rewriting the store changes its modification time, so its entries are not reused
+        time.sleep(0.01)
+        analytics_store.write_store(analytics_store.summaries_to_table(summaries), store_path)
+        misses = histogram_cache.cache_info()["png"]["misses"]
+        histogram_cache.histogram_png(store_path, dates[-1], histogram_figure)
+        assert histogram_cache.cache_info()["png"]["misses"] == misses + 1
+
+        print(f"Histogram views of {n_dates} dates ({views} views, cache of {max_entries}):")
+        print(f"  render every view {uncached_time * 1e3:.1f} ms, through the cache "
+              f"{cached_time * 1e3:.2f} ms per view ({uncached_time / cached_time:.0f}x)")
+        for kind, counters in info.items():
+            print(f"  {kind}: hits {counters['hits']}, misses {counters['misses']}, "
+                  f"evictions {counters['evictions']}, {counters['entries']} entries, "
+                  f"{counters['bytes'] / 1024:.0f} KiB")
+    finally:
+        histogram_cache.MAX_ENTRIES = default_entries
+        histogram_cache.clear_cache()
+        shutil.rmtree(tmp)
+
+
+BENCHMARKS = {
+    "ndvi": benchmark_ndvi,
+    "cog": benchmark_cog,
+    "remote_reads": benchmark_remote_reads,
+    "uploads": benchmark_uploads,
+    "ndvi_encoding": benchmark_ndvi_encoding,
+    "quantiles": benchmark_quantiles,
+    "analytics_store": benchmark_analytics_store,
+    "histogram_cache": benchmark_histogram_cache,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,147 @@
+"""
+This module caches the data and the rendered images of the Analytics tab histograms for the
+whole server process, so a date viewed once is served from memory to every session afterwards.
+
+Shiny express runs app.py again for every session, so anything created there is per session;
+this module is imported once per process, and its cache is shared by all the sessions.
+
+1. **Store**: the analytics store (see analytics_store) is opened memory-mapped once, and opened
+   again only when the file's modification time changes, i.e. when the pipeline updated it.
+2. **Histogram data and PNG images**: both are cached by date and store modification time, so an
+   update of the store never serves stale entries. They share one least recently used cache,
+   whose entries are evicted once it holds more than MAX_ENTRIES entries or MAX_BYTES bytes.
+
+cache_info returns the hit and miss counters of each kind of entry ("payload" for the histogram
+data, "png" for the images), so the "png" counters are those of the views.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+
+from analytics_store import histogram_data, open_store
+
+MB = 1024 * 1024
+
+# Size caps of the cache
+MAX_ENTRIES = 512
+MAX_BYTES = 64 * MB
+
+_CACHE_LOCK = threading.Lock()
+_CACHE = OrderedDict()
+_KINDS = ("payload", "png")
+_COUNTERS = {kind: {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+             for kind in _KINDS}
+_STORES = {}
+
+
+def cached(kind, key, compute, size):
+    """
+    Returns the cached value of key, or computes it with compute() and caches it, evicting the
+    least recently used entries while the cache is over MAX_ENTRIES or MAX_BYTES.
+
+    Parameters:
+    kind (str): The kind of value, one of _KINDS, whose counters are updated.
+    key (tuple): The key of the value, including everything the value depends on.
+    compute (callable): Computes the value on a miss.
+    size (callable): Returns the size of the value in bytes.
+    """
+    key, counters = (kind, *key), _COUNTERS[kind]
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            counters["hits"] += 1
+            return _CACHE[key][0]
+        counters["misses"] += 1
+
+    # Computed outside the lock, so a slow render doesn't block the other sessions
+    value = compute()
+    nbytes = size(value)
+
+    with _CACHE_LOCK:
+        if key not in _CACHE:
+            _CACHE[key] = (value, nbytes)
+            counters["entries"] += 1
+            counters["bytes"] += nbytes
+        while len(_CACHE) > MAX_ENTRIES or (_total_bytes() > MAX_BYTES and len(_CACHE) > 1):
+            (evicted_kind, *_), (_, evicted) = _CACHE.popitem(last=False)
+            _COUNTERS[evicted_kind]["entries"] -= 1
+            _COUNTERS[evicted_kind]["bytes"] -= evicted
+            _COUNTERS[evicted_kind]["evictions"] += 1
+    return value
+
+
+def _total_bytes():
+    return sum(counters["bytes"] for counters in _COUNTERS.values())
+
+
+def cache_info():
+    """
+    Returns, for each kind of entry ("payload" and "png"), its hits, misses and evictions
+    since the process started, with the number of entries and bytes the cache holds.
+    """
+    with _CACHE_LOCK:
+        return {kind: dict(counters) for kind, counters in _COUNTERS.items()}
+
+
+def clear_cache():
+    """
+    Empties the cache and resets its counters.
+    """
+    with _CACHE_LOCK:
+        _CACHE.clear()
+        for counters in _COUNTERS.values():
+            counters.update(hits=0, misses=0, evictions=0, entries=0, bytes=0)
+
+
+def get_store(store_path):
+    """
+    Returns the analytics store at store_path and its modification time, opening it again
+    only when the file changed since it was last opened.
+    """
+    mtime = os.path.getmtime(store_path)
+    with _CACHE_LOCK:
+        opened = _STORES.get(store_path)
+        if opened is None or opened[0] != mtime:
+            opened = _STORES[store_path] = (mtime, open_store(store_path))
+    return opened[1], mtime
+
+
+def histogram_payload(store_path, date):
+    """
+    Returns the histogram data of a date (see analytics_store.histogram_data), or None if the
+    date is not in the store.
+
+    Parameters:
+    store_path (str): Path of the analytics store.
+    date (str): The date as YYYY-MM-DD.
+    """
+    store, mtime = get_store(store_path)
+    return cached("payload", (store_path, mtime, date), lambda: histogram_data(store, date),
+                  lambda payload: 0 if payload is None else
+                  payload['counts'].nbytes + payload['bins'].nbytes)
+
+
+def histogram_png(store_path, date, plot, dpi=100):
+    """
+    Returns the histogram image of a date as PNG bytes.
+
+    Parameters:
+    store_path (str): Path of the analytics store.
+    date (str): The date as YYYY-MM-DD.
+    plot (callable): Draws the histogram: called with the date's histogram data (None if the
+        date is not in the store) and returns a matplotlib figure.
+    dpi (int, optional): The resolution of the image. Defaults to 100.
+    """
+    def render():
+        fig = plot(histogram_payload(store_path, date))
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi)
+        plt.close(fig)
+        return buffer.getvalue()
+
+    _, mtime = get_store(store_path)
+    return cached("png", (store_path, mtime, date, dpi), render, len)
@@ -13,27 +13,106 @@ The workflow includes:
 5. Saving the NDVI and other band rasters as Cloud Optimized GeoTIFFs.
 6. Creating mosaics of the processed bands and adding overviews for faster 
    rendering in web applications.
-7. Optionally uploading the mosaics to an S3 cloud bucket.
+7. Optionally uploading the mosaics to an S3 cloud bucket in the background
+   while the next dates are processed.
 
 The script is designed to handle multiple dates and can be easily modified 
 to process different geographic areas or time frames.
 """
 
 import glob
+import hashlib
+import json
 import os
-from datetime import datetime as dt, timedelta
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import datetime as dt, timedelta, timezone
+from functools import partial
 
 import geopandas as gpd
 import numpy as np
 import rasterio
+import rasterio.shutil
 import rioxarray
 import xarray as xr
+from pystac import ItemCollection
 from pystac_client import Client
+from rasterio.crs import CRS
 from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform, transform_bounds
+from rasterio.windows import Window, from_bounds
 from rioxarray.merge import merge_arrays
-
-from upload_to_DO import connect_s3_client, upload_image_to_s3
-
+from shapely.geometry import box, shape
+
+from analytics_store import STORE_FILE
+from ndvi_stats import (CLOUD_VALUES, add_ndvi_block, add_scl_block, block_windows,
+                        date_summary, empty_accumulator, finish_summary, histogram_percentiles,
+                        load_summary, pixel_weight, save_summary, store_date)
+from pipeline_manifest import (load_manifest, product_is_current, record_product,
+                               record_scene, save_manifest, scene_is_current)
+from upload_to_DO import flush_publisher, get_s3_client, publish, start_publisher
+
+# GDAL settings for range reads of remote COGs: skip directory listings on open
+# and merge neighbouring block requests
+os.environ.setdefault("GDAL_DISABLE_READDIR_ON_OPEN", "EMPTY_DIR")
+os.environ.setdefault("CPL_VSIL_CURL_ALLOWED_EXTENSIONS", ".tif")
+os.environ.setdefault("GDAL_HTTP_MERGE_CONSECUTIVE_RANGES", "YES")
+
+# GeoTIFF creation options shared by every raster written by the pipeline
+GTIFF_OPTIONS = dict(
+    driver="GTiff",
+    compress="LZW",
+    tiled=True,
+    blockxsize=256,
+    blockysize=256,
+    predictor=2,
+    bigtiff='IF_SAFER'
+)
+
+# Cloud Optimized GeoTIFF options for the mosaics: same tiling and compression as GTIFF_OPTIONS,
+# with internal overviews down to a single block and the ghost header laid out for range reads
+COG_OPTIONS = dict(
+    driver="COG",
+    compress="LZW",
+    blocksize=256,
+    predictor=2,
+    overviews="AUTO",
+    overview_resampling="average",
+    num_threads="ALL_CPUS",
+    bigtiff='IF_SAFER'
+)
+
+# Scaled-integer encoding of the NDVI mosaics: NDVI * 10000 stored as int16, with -32768 as nodata.
+# The scale and offset are written to the band metadata, so GDAL-based readers get NDVI back
+# (rioxarray with mask_and_scale=True, TiTiler with unscale=true) to within 5e-5.
+NDVI_INT16 = dict(dtype='int16', scale=1e-4, offset=0.0, nodata=-32768)
+
+# Pixel size in meters of the finest Sentinel-2 bands (Red, Green, Blue, NIR)
+NATIVE_RESOLUTION = 10
+
+# STAC assets read for every scene
+SCENE_ASSETS = ("red", "green", "blue", "nir", "scl")
+
+# Per-scene band rasters saved to disk, keyed by STAC asset name
+SCENE_BANDS = {"red": "red", "blue": "blue", "green": "green", "scl": "SCL"}
+
+# Layers of the optional per-scene stack, in band order; each band is described by its name
+STACK_BANDS = ("red", "green", "blue", "SCL", "NDVI")
+
+# Ways of choosing between overlapping scenes when mosaicking (see composite_block)
+COMPOSITE_METHODS = ("first", "least_cloud", "max_ndvi", "median")
+
+# Bands mosaicked for every date
+MOSAIC_BANDS = ("NDVI", "red", "green", "blue", "SCL")
+
+# Recorded in the manifest with every output. Bump it when a processing change
+# alters the rasters, so the next run rebuilds them instead of skipping them.
+PIPELINE_VERSION = 1
 
 # ------------------------------------------------------------------------------
 # 1. Environment and Geometry Setup
@@ -48,27 +127,69 @@ def setup_environment(working_directory):
     print(f"Working directory set to: {os.getcwd()}")
 
 
-def load_county_geometry(fips_code):
+def load_county_geometry(fips_code, simplify_tolerance=None, cache_dir="vector_data/geometry_cache"):
     """
     Loads the geometry for a specified county based on its FIPS code from the Montana TIGER shapefile.
+    The dissolved outline is cached by cached_county_geometry, so only the first call reads the shapefile.
 
     Parameters:
     fips_code (str): The FIPS code of the county to load. MSO County = 063
+    simplify_tolerance (float, optional): When given, the UTM clip geometry is simplified with this
+        tolerance in meters, which speeds up every rio.clip. Defaults to None (full detail).
+    cache_dir (str, optional): The directory of the geometry cache. Defaults to "vector_data/geometry_cache".
 
     Returns:
     geopandas.GeoDataFrame: A GeoDataFrame containing the combined geometry of the specified county.
     
     """
+    combined_county = cached_county_geometry(fips_code, cache_dir=cache_dir)
+    geometry_umt = cached_county_geometry(
+        fips_code, "EPSG:32611", simplify_tolerance, cache_dir)
+    return combined_county, geometry_umt
 
-    # Load mso county TIGER shapefile
-    mso_county = gpd.read_file(
-        "vector_data/montana_TIGER/tl_2022_30_tabblock20/tl_2022_30_tabblock20.shp")
 
-    # Filter for the specified county FIPS code
-    filtered_county = mso_county[(mso_county['COUNTYFP20'] == fips_code)]
-    combined_county = filtered_county.dissolve(by='COUNTYFP20')
-    geometry_umt = combined_county.to_crs("EPSG:32611")
-    return combined_county, geometry_umt
+def cached_county_geometry(fips_code, crs=None, simplify_tolerance=None,
+                           cache_dir="vector_data/geometry_cache"):
+    """
+    Returns the dissolved county outline from a GeoParquet cache keyed by FIPS code, CRS and
+    simplification tolerance, building and caching it on the first request.
+
+    The statewide shapefile holds hundreds of thousands of census blocks, so dissolving it on
+    every startup takes tens of seconds, while reading the cached outline takes milliseconds.
+    A simplified outline is buffered by the tolerance before simplifying, so it still contains
+    the whole county.
+
+    Parameters:
+    fips_code (str): The FIPS code of the county.
+    crs (str, optional): The CRS of the outline. Defaults to None (the shapefile's CRS).
+    simplify_tolerance (float, optional): The simplification tolerance in crs units. Defaults to None.
+    cache_dir (str, optional): The directory of the geometry cache. Defaults to "vector_data/geometry_cache".
+
+    Returns:
+    geopandas.GeoDataFrame: The county outline.
+    """
+    crs_name = crs.replace(":", "") if crs else "native"
+    simplified = f"_simplified{simplify_tolerance:g}" if simplify_tolerance else ""
+    cache_file = f"{cache_dir}/county_{fips_code}_{crs_name}{simplified}.parquet"
+    if os.path.exists(cache_file):
+        return gpd.read_parquet(cache_file)
+
+    if crs is None:
+        # Read only the county's census blocks from the TIGER shapefile
+        filtered_county = gpd.read_file(
+            "vector_data/montana_TIGER/tl_2022_30_tabblock20/tl_2022_30_tabblock20.shp",
+            where=f"COUNTYFP20 = '{fips_code}'")
+        county = filtered_county[['COUNTYFP20', 'geometry']].dissolve(by='COUNTYFP20')
+    else:
+        county = cached_county_geometry(fips_code, cache_dir=cache_dir).to_crs(crs)
+
+    if simplify_tolerance:
+        county['geometry'] = county.buffer(simplify_tolerance).simplify(
+            simplify_tolerance, preserve_topology=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    county.to_parquet(cache_file)
+    return county
 
 # ------------------------------------------------------------------------------
 # 2. STAC Searching
@@ -81,10 +202,12 @@ def search_sentinel_scenes(date_str, geometry, collection, client):
     on the given date. Returns an ItemCollection if any scenes are found if at least 
     one scene contains less than 80% cloud coverage, otherwise None.
     """
+    # This converts the geopandas dataframe into a bounding box tuple
+    bbox = tuple(geometry.total_bounds)
+
     search = client.search(
         collections=[collection],
-        # This converts the geopandas dataframe into a bounding box tuple
-        bbox=geometry['geometry'].union_all().bounds,
+        bbox=bbox,
         datetime=date_str,
         # Looking for cloud coverage less than 65%
         query={"eo:cloud_cover": {"lt": 65}}
@@ -93,8 +216,7 @@ def search_sentinel_scenes(date_str, geometry, collection, client):
     if search.matched() > 0:
         search = client.search(
             collections=[collection],
-            # This converts the geopandas dataframe into a bounding box tuple
-            bbox=geometry['geometry'].union_all().bounds,
+            bbox=bbox,
             datetime=date_str
         )
         items = search.item_collection()
@@ -105,25 +227,245 @@ def search_sentinel_scenes(date_str, geometry, collection, client):
         return None
 
 
+def search_sentinel_season(start_date, end_date, geometry, collection, client,
+                           cache_dir="stac_cache", max_cloud_cover=65):
+    """
+    Runs one STAC search for a whole date range and groups the scenes by acquisition date.
+    A date is kept when at least one of its scenes has less than max_cloud_cover percent
+    cloud coverage, and then all of its scenes are returned, like search_sentinel_scenes.
+
+    Search responses are cached on disk (see cached_search), so reruns and backfills of the
+    same range don't call the API again. A static pystac.Catalog can be passed as client
+    to search a local catalog instead of the API.
+
+    Parameters:
+    start_date (str): The first date of the range as YYYY-MM-DD.
+    end_date (str): The last date of the range (inclusive) as YYYY-MM-DD.
+    geometry (geopandas.GeoDataFrame): The geometry the scenes must intersect.
+    collection (str): The STAC collection to search.
+    client (pystac_client.Client or pystac.Catalog): The STAC API client or a static catalog.
+    cache_dir (str, optional): The directory of the search cache. Defaults to "stac_cache".
+    max_cloud_cover (float, optional): The cloud cover (percent) at least one scene must be below. Defaults to 65.
+
+    Returns:
+    dict: pystac.ItemCollection of each date with scenes, keyed by YYYY-MM-DD.
+    """
+    # This converts the geopandas dataframe into a bounding box tuple
+    bbox = tuple(float(b) for b in geometry.total_bounds)
+    items = cached_search(client, collection, bbox,
+                          f"{start_date}/{end_date}", cache_dir)
+
+    items_by_date = {}
+    for item in items:
+        items_by_date.setdefault(item.datetime.strftime("%Y-%m-%d"), []).append(item)
+
+    scenes_by_date = {
+        date_str: ItemCollection(date_items)
+        for date_str, date_items in sorted(items_by_date.items())
+        if any(item.properties.get("eo:cloud_cover", 100) < max_cloud_cover
+               for item in date_items)
+    }
+    print(f"{sum(len(items) for items in scenes_by_date.values())} Scenes matched on "
+          f"{len(scenes_by_date)} dates between {start_date} and {end_date}")
+    return scenes_by_date
+
+
+def cached_search(client, collection, bbox, datetime_range, cache_dir="stac_cache",
+                  recent_days=3, recent_ttl=3600):
+    """
+    Searches a STAC API once per unique query and keeps the response on disk.
+    The cache file name is a hash of the catalog URL, collection, bounding box and
+    date range, so any change to the query triggers a fresh search.
+    A query whose date range ends within recent_days of today (or is open-ended) can still
+    gain new acquisitions, so its cached response is only reused for recent_ttl seconds.
+    Static catalogs are read directly and are not cached.
+
+    Parameters:
+    client (pystac_client.Client or pystac.Catalog): The STAC API client or a static catalog.
+    collection (str): The STAC collection to search.
+    bbox (tuple): The bounding box (minx, miny, maxx, maxy) in EPSG:4326.
+    datetime_range (str): The date range as "YYYY-MM-DD/YYYY-MM-DD".
+    cache_dir (str, optional): The directory of the search cache. Defaults to "stac_cache".
+    recent_days (int, optional): How close to today the end date must be for the query to
+        count as recent. Defaults to 3.
+    recent_ttl (float, optional): How long, in seconds, the response of a recent query is
+        reused. Defaults to one hour.
+
+    Returns:
+    pystac.ItemCollection: The scenes matching the query.
+    """
+    if not hasattr(client, "search"):
+        return search_static_catalog(client, collection, bbox, datetime_range)
+
+    query = {"catalog": client.get_self_href(), "collection": collection,
+             "bbox": list(bbox), "datetime": datetime_range}
+    key = hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    cache_file = os.path.join(cache_dir, f"{key}.json")
+
+    end = datetime_range.split("/")[-1][:10]
+    recent = end in ("", "..") or (dt.strptime(end, "%Y-%m-%d").date()
+                                  >= dt.now(timezone.utc).date() - timedelta(days=recent_days))
+    expired = recent and (os.path.exists(cache_file)
+                          and time.time() - os.path.getmtime(cache_file) > recent_ttl)
+
+    if os.path.exists(cache_file) and not expired:
+        with open(cache_file) as f:
+            return ItemCollection.from_dict(json.load(f))
+
+    items = client.search(collections=[collection], bbox=bbox,
+                          datetime=datetime_range, limit=100).item_collection()
+
+    # Write to a temporary file first so an interrupted run never leaves a partial cache
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f"{cache_file}.tmp", "w") as f:
+        json.dump(items.to_dict(), f)
+    os.replace(f"{cache_file}.tmp", cache_file)
+    return items
+
+
+def search_static_catalog(catalog, collection, bbox, datetime_range):
+    """
+    Filters the items of a static STAC catalog like a STAC API search would:
+    by collection, by intersection with bbox and by acquisition date (end date inclusive).
+    Useful as a local stand-in for the API when testing.
+
+    Parameters:
+    catalog (pystac.Catalog): The static catalog, e.g. from pystac.Catalog.from_file.
+    collection (str): The STAC collection to search.
+    bbox (tuple): The bounding box (minx, miny, maxx, maxy) in EPSG:4326.
+    datetime_range (str): The date range as "YYYY-MM-DD/YYYY-MM-DD".
+
+    Returns:
+    pystac.ItemCollection: The matching items.
+    """
+    start_str, end_str = datetime_range.split("/")
+    start = dt.strptime(start_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end = dt.strptime(end_str, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+    search_box = box(*bbox)
+
+    return ItemCollection([
+        item for item in catalog.get_items(recursive=True)
+        if item.collection_id == collection
+        and item.geometry is not None and shape(item.geometry).intersects(search_box)
+        and start <= item.datetime < end
+    ])
+
+
 # ------------------------------------------------------------------------------
 # 3. Band Clipping and Masking
 # ------------------------------------------------------------------------------
-def clip_band(band_url, clip_geometry, target_crs="EPSG:32611"):
+def web_mercator_resolution(zoom):
+    """
+    Returns the pixel size in EPSG:3857 meters of the WebMercatorQuad tile grid at a zoom level.
+    A target grid with this resolution lines up pixel for pixel with the map tiles at that zoom.
+    """
+    return 2 * np.pi * 6378137 / (256 * 2 ** zoom)
+
+
+def build_target_grid(clip_geometry, crs="EPSG:3857", resolution=None):
+    """
+    Builds a fixed pixel grid in crs that covers the clip geometry. When every scene is
+    warped straight onto this grid, the bands are resampled exactly once, and the per-scene
+    rasters mosaic without another reprojection.
+
+    The grid is anchored at the origin of crs, so grids with the same resolution always line up.
+    With resolution = web_mercator_resolution(zoom) it matches the web map tiles. Bands with
+    coarser native pixels than the 10 m bands (such as the 20 m SCL) use a whole multiple of
+    the resolution, which keeps the two grids nested.
+
+    Parameters:
+    clip_geometry (geopandas.GeoDataFrame): The geometry the grid has to cover.
+    crs (str, optional): The CRS of the grid, e.g. "EPSG:3857" or an UTM zone. Defaults to "EPSG:3857".
+    resolution (float, optional): The pixel size of the 10 m bands in crs units. Defaults to the size
+        a 10 m pixel has at the geometry once warped to crs.
+
+    Returns:
+    dict: The grid's crs, resolution and bounds (left, bottom, right, top).
+    """
+    bounds = transform_bounds(clip_geometry.crs, crs, *clip_geometry.total_bounds)
+
+    if resolution is None:
+        utm_bounds = transform_bounds(clip_geometry.crs, "EPSG:32611", *clip_geometry.total_bounds)
+        width = int(np.ceil((utm_bounds[2] - utm_bounds[0]) / NATIVE_RESOLUTION))
+        height = int(np.ceil((utm_bounds[3] - utm_bounds[1]) / NATIVE_RESOLUTION))
+        res_transform, _, _ = calculate_default_transform(
+            "EPSG:32611", crs, width, height, *utm_bounds)
+        resolution = res_transform.a
+
+    return {"crs": crs, "resolution": resolution,
+            "bounds": snap_bounds(bounds, resolution)}
+
+
+def snap_bounds(bounds, resolution):
+    """
+    Expands bounds (left, bottom, right, top) outward to whole multiples of resolution.
+    """
+    left, bottom, right, top = bounds
+    return (np.floor(left / resolution) * resolution,
+            np.floor(bottom / resolution) * resolution,
+            np.ceil(right / resolution) * resolution,
+            np.ceil(top / resolution) * resolution)
+
+
+def grid_subset(target_grid, bounds, factor=1):
+    """
+    Returns the part of target_grid that covers bounds, as the transform and shape
+    to pass to rio.reproject.
+
+    Parameters:
+    target_grid (dict): A grid built by build_target_grid.
+    bounds (tuple): The area to cover (left, bottom, right, top) in the grid's CRS.
+    factor (int, optional): How many grid pixels wide one output pixel is. Defaults to 1.
+
+    Returns:
+    tuple: (affine.Affine transform, (height, width)) of the grid subset.
+    """
+    resolution = target_grid["resolution"] * factor
+    grid_left, grid_bottom, grid_right, grid_top = target_grid["bounds"]
+    left, bottom, right, top = snap_bounds(
+        (max(bounds[0], grid_left), max(bounds[1], grid_bottom),
+         min(bounds[2], grid_right), min(bounds[3], grid_top)), resolution)
+
+    width = max(1, int(round((right - left) / resolution)))
+    height = max(1, int(round((top - bottom) / resolution)))
+    return from_origin(left, top, resolution, resolution), (height, width)
+
+
+def clip_band(band_url, clip_geometry, target_crs="EPSG:32611", target_grid=None):
     """
     This function opens a band from a STAC asset, reprojects to target_crs if needed,
     then clips it to the clip_geometry.
+    Before anything is read, the band is cut to the window of the granule that covers the
+    clip geometry's bounds, so only the COG blocks inside that window are fetched and warped.
 
     Parameters:
     band_url (str): The URL of the band to be opened.
     clip_geometry (geopandas.GeoDataFrame): The geometry to clip the band to.
     target_crs (str, optional): The target CRS to reproject the band to. Defaults to "EPSG:32611".
+    target_grid (dict, optional): A grid from build_target_grid. When given, the band is warped
+        straight onto that grid instead of to target_crs.
 
     Returns:
     rioxarray.DataArray: The clipped band.
     """
-    band = rioxarray.open_rasterio(band_url, chunks={"x": 1024, "y": 1024})
-
-    if band.rio.crs != target_crs:
+    # lock=False gives each thread its own dataset handle; rioxarray's default process-wide
+    # lock would make the scene and date threads read one at a time
+    band = rioxarray.open_rasterio(band_url, chunks={"x": 1024, "y": 1024}, lock=False)
+
+    # Restrict the lazy read to the clip geometry's footprint in the source CRS,
+    # padded by a couple of pixels so edge pixels survive the warp
+    minx, miny, maxx, maxy = transform_bounds(
+        clip_geometry.crs, band.rio.crs, *clip_geometry.total_bounds)
+    pad = 2 * max(abs(res) for res in band.rio.resolution())
+    band = band.rio.clip_box(minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    if target_grid is not None:
+        # Warp once onto the shared grid, keeping coarser bands on a nested coarser grid
+        factor = max(1, int(round(abs(band.rio.resolution()[0]) / NATIVE_RESOLUTION)))
+        bounds = transform_bounds(band.rio.crs, target_grid["crs"], *band.rio.bounds())
+        transform, shape = grid_subset(target_grid, bounds, factor)
+        band = band.rio.reproject(target_grid["crs"], transform=transform, shape=shape)
+    elif band.rio.crs != target_crs:
         band = band.rio.reproject(target_crs)
 
     band = band.rio.clip(clip_geometry.geometry.tolist(),
@@ -131,39 +473,62 @@ def clip_band(band_url, clip_geometry, target_crs="EPSG:32611"):
     return band
 
 
-def get_vegetation_pixels(target_band, scl_band, clip_geometry, target_crs="EPSG:32611"):
+def load_scene_bands(scene, geometry_utm, asset_keys=SCENE_ASSETS, target_grid=None):
     """
-    Masks the target_band (Red or NIR) to include only vegetation pixels
-    using the SCL band (value == 4), after clipping the bands to the specified geometry.
+    Opens, reprojects and clips each requested asset of a STAC scene exactly once.
+    The clipped bands are loaded into memory so the saved band rasters, the vegetation
+    mask and the NDVI all reuse the same pixels instead of fetching and warping the
+    remote asset again.
 
     Parameters:
-    target_band (rioxarray.DataArray): The target band to be masked.
-    scl_band (rioxarray.DataArray): The SCL band to be used for masking.
-    clip_geometry (geopandas.GeoDataFrame): The geometry to clip the bands to.
-    target_crs (str, optional): The target CRS to reproject the band to. Defaults to "EPSG:32611".
+    scene (pystac.Item): A STAC scene containing assets.
+    geometry_utm (geopandas.GeoDataFrame): The geometry to clip the bands to in UTM projection.
+    asset_keys (tuple, optional): The STAC asset names to load. Defaults to all bands used by the pipeline.
+    target_grid (dict, optional): A grid from build_target_grid to warp the bands onto.
 
     Returns:
-    rioxarray.DataArray: The masked band.
+    dict: The clipped bands (rioxarray.DataArray) keyed by asset name.
     """
-    if scl_band.rio.crs != target_crs:
-        scl_band = scl_band.rio.reproject(target_crs)
+    return {key: clip_band(scene.assets[key].href, geometry_utm,
+                           target_grid=target_grid).load()
+            for key in asset_keys}
 
-    # Clip both bands to the specified geometry
-    scl_band = scl_band.rio.clip(
-        clip_geometry.geometry.tolist(), crs=target_crs, drop=False)
-    target_band = target_band.rio.clip(
-        clip_geometry.geometry.tolist(), crs=target_crs, drop=False)
 
+def get_vegetation_mask(scl_band, target_band):
+    """
+    Builds a vegetation mask (SCL value == 4) on the grid of target_band.
+    Bands that share a grid (Red and NIR) can reuse the same mask.
+
+    Parameters:
+    scl_band (rioxarray.DataArray): The clipped SCL band to be used for masking.
+    target_band (rioxarray.DataArray): The clipped band whose grid the mask is built on.
+
+    Returns:
+    xarray.DataArray: A boolean mask that is True for vegetation pixels.
+    """
     # Resample SCL to match the resolution of target_band
     scl_resampled = scl_band.rio.reproject_match(target_band)
-    vegetation_mask = scl_resampled == 4  # Create a mask for vegetation pixels
-    band_masked = target_band.where(
-        vegetation_mask, np.nan)  # Apply the mask to the band
+    # Reuse the target coordinates so the mask aligns exactly with the band
+    scl_resampled = scl_resampled.assign_coords(
+        x=target_band.x, y=target_band.y)
+    return scl_resampled == 4
 
-    return band_masked
 
+def get_vegetation_pixels(target_band, vegetation_mask):
+    """
+    Masks the target_band (Red or NIR) to include only vegetation pixels.
+
+    Parameters:
+    target_band (rioxarray.DataArray): The target band to be masked.
+    vegetation_mask (xarray.DataArray): The mask returned by get_vegetation_mask.
 
-def clip_and_mask_bands(scene, geometry_utm):
+    Returns:
+    rioxarray.DataArray: The masked band.
+    """
+    return target_band.where(vegetation_mask, np.nan)
+
+
+def clip_and_mask_bands(scene, geometry_utm, bands=None):
     """
     From a STAC scene, clip and mask the Red, NIR, and SCL bands.
     Returns: (red_band_masked, nir_band_masked)
@@ -171,21 +536,20 @@ def clip_and_mask_bands(scene, geometry_utm):
     Parameters:
     scene (dict): A STAC scene containing assets.
     geometry_utm (geopandas.GeoDataFrame): The geometry to clip the bands to in UTM projection.
+    bands (dict, optional): Bands already loaded with load_scene_bands. Missing bands are read from the scene.
 
     Returns:
     rioxarray.DataArray: The clipped and masked Red band.
     """
-    assets = scene.assets
-    # Clip Red and NIR
-    red_band = clip_band(assets['red'].href, geometry_utm)
-    nir_band = clip_band(assets['nir'].href, geometry_utm)
+    if bands is None:
+        bands = load_scene_bands(scene, geometry_utm, ("red", "nir", "scl"))
 
-    # Load SCL (mask layer)
-    scl_band = clip_band(assets['scl'].href, geometry_utm)
+    # Red and NIR share the 10 m grid, so the SCL is resampled only once
+    vegetation_mask = get_vegetation_mask(bands['scl'], bands['red'])
 
     # Mask Red and NIR for vegetation
-    red_band_masked = get_vegetation_pixels(red_band, scl_band, geometry_utm)
-    nir_band_masked = get_vegetation_pixels(nir_band, scl_band, geometry_utm)
+    red_band_masked = get_vegetation_pixels(bands['red'], vegetation_mask)
+    nir_band_masked = get_vegetation_pixels(bands['nir'], vegetation_mask)
 
     # Align both raster layers
     red_band_masked, nir_band_masked = xr.align(
@@ -196,6 +560,47 @@ def clip_and_mask_bands(scene, geometry_utm):
 # ------------------------------------------------------------------------------
 # 4. NDVI Computation and Saving
 # ------------------------------------------------------------------------------
+def _normalized_difference_kernel(band_a, band_b):
+    """
+    Computes (band_a - band_b) / (band_a + band_b) on plain numpy blocks in float32.
+    The ratio, the zero-denominator and zero-result handling and the cast are done in
+    a single pass over the block, and NaN inputs propagate to NaN outputs.
+    """
+    numerator = np.subtract(band_a, band_b, dtype=np.float32)
+    denominator = np.add(band_a, band_b, dtype=np.float32)
+
+    # Divide in place, skipping pixels where the denominator is zero
+    invalid = denominator == 0
+    np.divide(numerator, denominator, out=numerator, where=~invalid)
+
+    # Zero-denominator and zero-valued pixels become NaN
+    invalid |= numerator == 0
+    numerator[invalid] = np.nan
+    return numerator
+
+
+def normalized_difference(band_a, band_b):
+    """
+    Computes a normalized difference index (band_a - band_b) / (band_a + band_b)
+    chunk by chunk. Dask-backed inputs stay lazy and chunked until the result is
+    written, and the coordinates of the inputs are kept.
+
+    Works for any normalized difference index, for example:
+    NDVI = normalized_difference(nir, red)
+    NDWI = normalized_difference(green, nir)
+    NDRE = normalized_difference(nir, rededge1)
+
+    Parameters:
+    band_a (xarray.DataArray): The first band of the index.
+    band_b (xarray.DataArray): The second band of the index, aligned with band_a.
+
+    Returns:
+    xarray.DataArray: The float32 index, NaN where either input is NaN or the denominator or result is 0.
+    """
+    return xr.apply_ufunc(_normalized_difference_kernel, band_a, band_b,
+                          dask="parallelized", output_dtypes=[np.float32])
+
+
 def compute_ndvi(red_band_masked, nir_band_masked):
     """
     Computes the NDVI: (NIR - Red) / (NIR + Red) for non-NaN,
@@ -208,19 +613,7 @@ def compute_ndvi(red_band_masked, nir_band_masked):
     Returns:
     rioxarray.DataArray: The computed NDVI.
     """
-    # Compute the numerator and denominator separately.
-    numerator = nir_band_masked - red_band_masked
-    denominator = nir_band_masked + red_band_masked
-
-    # Use xr.where to avoid division when the denominator is zero.
-    ndvi = xr.where(denominator == 0, np.nan, numerator / denominator)
-
-    # Replace 0 values with NaN
-    ndvi = np.where(ndvi == 0, np.nan, ndvi)
-
-    # Ensure that pixels with NaNs in the original bands remain NaN.
-    ndvi = xr.where(xr.ufuncs.isnan(red_band_masked) | xr.ufuncs.isnan(nir_band_masked),
-                    np.nan, ndvi)
+    ndvi = normalized_difference(nir_band_masked, red_band_masked)
 
     # Write the CRS from one of the bands.
     ndvi = ndvi.rio.write_crs(red_band_masked.rio.crs)
@@ -228,7 +621,29 @@ def compute_ndvi(red_band_masked, nir_band_masked):
     return ndvi
 
 
-def save_raster(raster, band, scene_id, output_path):
+def encode_block(block, encoding):
+    """
+    Encodes float values with NaN nodata to a scaled-integer encoding such as NDVI_INT16:
+    round((value - offset) / scale), with NaN pixels set to the encoding's nodata value.
+    """
+    info = np.iinfo(encoding["dtype"])
+    encoded = np.round((block - encoding["offset"]) / encoding["scale"])
+    encoded = np.clip(encoded, info.min + 1, info.max)
+    encoded[np.isnan(block)] = encoding["nodata"]
+    return encoded.astype(encoding["dtype"])
+
+
+def decode_block(encoded, encoding):
+    """
+    Decodes a block written with encode_block back to float values, as a reader applying the
+    band's scale and offset sees them, with nodata pixels as NaN.
+    """
+    decoded = encoded.astype('float64') * encoding["scale"] + encoding["offset"]
+    decoded[encoded == encoding["nodata"]] = np.nan
+    return decoded
+
+
+def save_raster(raster, band, scene_id, output_path, encoding=None):
     """
     Saves a RGB raster to disk as Cloud Optimized GeoTIFF.
 
@@ -236,6 +651,8 @@ def save_raster(raster, band, scene_id, output_path):
     raster (rioxarray.DataArray): The raster to be saved.
     scene_id (str): The ID of the scene to be used in the output file name.
     output_path (str): The directory where the raster will be saved.
+    encoding (dict, optional): A scaled-integer encoding such as NDVI_INT16 to store the
+        values with instead of float32.
     """
     if band == 'RGB':
         output_file = f"{output_path}/RGB_{scene_id}.tif"
@@ -248,28 +665,349 @@ def save_raster(raster, band, scene_id, output_path):
         dtype = 'float32'
         nodata = np.nan
 
+    if encoding is not None:
+        # rioxarray writes scale_factor and add_offset as the band's scale and offset
+        raster = raster.copy(data=encode_block(raster.values, encoding))
+        raster = raster.rio.write_nodata(encoding["nodata"])
+        raster.attrs.update(scale_factor=encoding["scale"], add_offset=encoding["offset"])
+        dtype = encoding["dtype"]
+        nodata = encoding["nodata"]
+
     raster = raster.astype(dtype)  # Convert to 8-bit unsigned integer
 
     raster.rio.to_raster(
         output_file,
-        driver="GTiff",
-        compress="LZW",
-        tiled=True,
-        blockxsize=256,
-        blockysize=256,
         photometric=photometric,
-        predictor=2,
         nodata=nodata,
-        bigtiff='IF_SAFER',
-        overview_resampling='average'
+        overview_resampling='average',
+        **GTIFF_OPTIONS
     )
     print(f"Saved {band} raster to {output_file}")
 
 
+@contextmanager
+def cog_output(output_file, cog=True):
+    """
+    Yields the path a writer should write output_file to. With cog, the writer fills a
+    temporary tiled GTiff next to output_file, which is then copied once into a Cloud Optimized
+    GeoTIFF with its overviews (see COG_OPTIONS) and removed. This replaces writing the GTiff and
+    appending overviews in place with add_overviews, which leaves the overviews after the
+    full-resolution data instead of in the COG layout.
+
+    Parameters:
+    output_file (str): Path of the raster to produce.
+    cog (bool, optional): Produce a COG. If False, the writer writes output_file directly.
+    """
+    if not cog:
+        yield output_file
+        return
+
+    # Dot-prefixed, so the per-scene globs of find_band_files never pick it up
+    tmp_file = os.path.join(os.path.dirname(output_file),
+                            f".{os.path.basename(output_file)}.tmp.tif")
+    try:
+        yield tmp_file
+        rasterio.shutil.copy(tmp_file, output_file, **COG_OPTIONS)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def save_scene_stack(layers, scene_id, output_path):
+    """
+    Saves the layers of a scene as a single band-interleaved tiled GeoTIFF, stack_{scene_id}.tif,
+    with one band per entry of STACK_BANDS named by its band description.
+    One file per scene instead of five keeps file handles, header parsing and directory
+    listings down on slow external and network volumes. Each band's tiles are stored and
+    compressed separately, so the mosaics reading one layer don't decompress the other four.
+
+    Parameters:
+    layers (dict): The layers (rioxarray.DataArray) keyed by the names in STACK_BANDS,
+        all on the grid of the Red band.
+    scene_id (str): The ID of the scene to be used in the output file name.
+    output_path (str): The directory where the stack will be saved.
+    """
+    output_file = f"{output_path}/stack_{scene_id}.tif"
+    first = layers[STACK_BANDS[0]]
+    # The GTiff driver, since the COG driver ignores INTERLEAVE=BAND before GDAL 3.11.
+    # Stacks are only read at full resolution by the mosaics, so they have no overviews.
+    profile = dict(GTIFF_OPTIONS, interleave='band', width=first.rio.width,
+                   height=first.rio.height, count=len(STACK_BANDS), dtype='float32',
+                   crs=first.rio.crs, transform=first.rio.transform(), nodata=np.nan)
+    with rasterio.open(output_file, 'w', **profile) as dst:
+        for bidx, name in enumerate(STACK_BANDS, start=1):
+            dst.write(np.asarray(layers[name], dtype='float32').squeeze(), bidx)
+            dst.set_band_description(bidx, name)
+    print(f"Saved {len(STACK_BANDS)}-band stack to {output_file}")
+
+
 # ------------------------------------------------------------------------------
 # 5. Mosaic Creation
 # ------------------------------------------------------------------------------
-def create_mosaic(band_name, output_path, target_crs="EPSG:32611"):
+def find_band_files(band_name, output_path):
+    """
+    Returns the per-scene raster files for band_name in output_path,
+    leaving out a mosaic written by an earlier run and temporary files left by an
+    interrupted one. The files are sorted: glob order is arbitrary, and the scene that wins
+    overlaps in the mosaics (and, before mosaic_grid used every input, the mosaic grid itself,
+    which could leave red, green and blue on different grids) must not depend on it.
+    """
+    return [file for file in sorted(glob.glob(f"{output_path}/{band_name}_*.tif"))
+            if not file.endswith("_mosaic.tif") and ".tmp" not in os.path.basename(file)]
+
+
+def find_scene_sources(band_name, output_path):
+    """
+    Returns the (path, band index) of every per-scene raster holding band_name in output_path,
+    keyed by scene ID: band 1 of the single-band files from find_band_files, and the band_name
+    band of each per-scene stack written by save_scene_stack.
+    """
+    sources = {}
+    for file in find_band_files(band_name, output_path):
+        sources[os.path.basename(file)[len(band_name) + 1:-len(".tif")]] = (file, 1)
+    if band_name in STACK_BANDS:
+        bidx = STACK_BANDS.index(band_name) + 1
+        for file in glob.glob(f"{output_path}/stack_*.tif"):
+            sources[os.path.basename(file)[len("stack_"):-len(".tif")]] = (file, bidx)
+    return sources
+
+
+def find_band_sources(band_name, output_path):
+    """
+    Returns the (path, band index) of every per-scene raster holding band_name in output_path
+    (see find_scene_sources), ordered by scene ID so mosaics don't depend on directory order.
+    """
+    sources = find_scene_sources(band_name, output_path)
+    return [sources[scene_id] for scene_id in sorted(sources)]
+
+
+def mosaic_grid(datasets, target_crs):
+    """
+    Computes the output grid of a mosaic: the union of the input bounds in target_crs,
+    at the finest resolution of the inputs once warped to target_crs.
+    The grid doesn't depend on the order of the inputs, so mosaics of different bands
+    built from the same scenes (red, green and blue) always share one grid.
+
+    Parameters:
+    datasets (list): Open rasterio datasets of the mosaic inputs.
+    target_crs (str): The Coordinate Reference System of the mosaic.
+
+    Returns:
+    tuple: (affine.Affine transform, width, height) of the mosaic grid.
+    """
+    resolutions = []
+    for ds in datasets:
+        if ds.crs == CRS.from_user_input(target_crs):
+            resolutions.append(ds.res)
+        else:
+            res_transform, _, _ = calculate_default_transform(
+                ds.crs, target_crs, ds.width, ds.height, *ds.bounds)
+            resolutions.append((res_transform.a, -res_transform.e))
+    xres = min(res[0] for res in resolutions)
+    yres = min(res[1] for res in resolutions)
+
+    bounds = [transform_bounds(ds.crs, target_crs, *ds.bounds)
+              for ds in datasets]
+    left = min(b[0] for b in bounds)
+    bottom = min(b[1] for b in bounds)
+    right = max(b[2] for b in bounds)
+    top = max(b[3] for b in bounds)
+
+    # The tolerance keeps inputs on a shared grid from gaining a sliver column
+    width = int(np.ceil((right - left) / xres - 1e-6))
+    height = int(np.ceil((top - bottom) / yres - 1e-6))
+    return from_origin(left, top, xres, yres), width, height
+
+
+def mosaic_source(ds, target_crs, transform, width, height, stack, bidx=1):
+    """
+    Prepares one mosaic input for block reads on the mosaic grid.
+    An input that already sits on the mosaic grid (same CRS and resolution, whole-pixel offset)
+    is read directly, so mosaicking is a pure block copy. Any other input is warped on the fly
+    through a WarpedVRT.
+
+    Parameters:
+    ds (rasterio.DatasetReader): The open mosaic input.
+    target_crs (str): The Coordinate Reference System of the mosaic.
+    transform (affine.Affine): The transform of the mosaic grid.
+    width (int): The width of the mosaic grid.
+    height (int): The height of the mosaic grid.
+    stack (contextlib.ExitStack): Keeps any WarpedVRT open while the mosaic is written.
+    bidx (int, optional): The band of ds to read. Defaults to 1.
+
+    Returns:
+    tuple: (read, footprint) where read(window) returns the input's float32 pixels over a window
+        of the mosaic grid (NaN outside the input) and footprint is the input's window in that grid.
+    """
+    footprint = from_bounds(
+        *transform_bounds(ds.crs, target_crs, *ds.bounds), transform=transform)
+    col_off, row_off = round(footprint.col_off), round(footprint.row_off)
+
+    aligned = (ds.crs == CRS.from_user_input(target_crs)
+               and np.allclose(ds.res, (transform.a, -transform.e))
+               and np.isclose(footprint.col_off, col_off)
+               and np.isclose(footprint.row_off, row_off))
+
+    if aligned:
+        def read(window):
+            return ds.read(bidx, window=Window(window.col_off - col_off, window.row_off - row_off,
+                                            window.width, window.height),
+                           boundless=True, fill_value=np.nan, out_dtype='float32')
+    else:
+        vrt = stack.enter_context(WarpedVRT(
+            ds, crs=target_crs, transform=transform, width=width, height=height,
+            resampling=Resampling.nearest, dtype='float32', nodata=np.nan))
+
+        def read(window):
+            return vrt.read(bidx, window=window)
+
+    return read, footprint
+
+
+def composite_block(values, method="first", scl=None, ndvi=None, cloud_values=CLOUD_VALUES):
+    """
+    Composites the pixels of several overlapping scenes over one block of the mosaic grid.
+    A pixel is valid where it is neither NaN nor zero (the fill value outside the clip geometry).
+    Pixels with an SCL of cloud, shadow or snow (cloud_values), or no SCL at all, count as cloudy.
+
+    Methods:
+    - first: the first scene with a valid pixel, as with merge_arrays.
+    - least_cloud: the first scene with a valid clear pixel, else the first valid pixel.
+    - max_ndvi: the valid pixel with the highest NDVI, which favours clear, green observations;
+      where no scene has NDVI (non-vegetation pixels), falls back to least_cloud.
+    - median: the median of the valid clear pixels, else of all valid pixels. Only meaningful
+      for continuous bands.
+    Ties go to the earlier scene, so the result only depends on the order of the scenes.
+
+    Parameters:
+    values (numpy.ndarray): The band of each scene over the block, shaped (scenes, rows, cols).
+    method (str, optional): One of COMPOSITE_METHODS. Defaults to "first".
+    scl (numpy.ndarray, optional): The SCL of each scene over the block, same shape as values.
+    ndvi (numpy.ndarray, optional): The NDVI of each scene over the block, same shape as values.
+    cloud_values (list): List of SCL values representing clouds, snow, or shadows.
+
+    Returns:
+    numpy.ndarray: The float32 composite of the block, NaN where no scene is valid.
+    """
+    valid = ~np.isnan(values) & (values != 0)
+    if method != "first":
+        cloudy = np.isin(scl, cloud_values) | np.isnan(scl) | (scl == 0)
+
+    if method == "median":
+        clear = valid & ~cloudy
+        use = np.where(clear.any(axis=0), clear, valid)
+        with warnings.catch_warnings():
+            # Pixels without any valid scene are all-NaN slices and stay NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmedian(np.where(use, values, np.nan), axis=0).astype('float32')
+
+    # Lower scores win; invalid pixels never do
+    if method == "first":
+        score = np.where(valid, 0.0, np.inf)
+    elif method == "least_cloud":
+        score = np.where(valid, cloudy, np.inf)
+    elif method == "max_ndvi":
+        # -NDVI lies in [-1, 1], so any pixel with NDVI beats the cloud-ranked fallback.
+        # compute_ndvi never returns 0, so 0 is a fill value like NaN.
+        has_ndvi = ~np.isnan(ndvi) & (ndvi != 0)
+        score = np.where(valid, np.where(has_ndvi, -ndvi, 2.0 + cloudy), np.inf)
+    else:
+        raise ValueError(f"Unknown composite method {method!r}, expected one of "
+                         f"{COMPOSITE_METHODS}")
+
+    best = np.argmin(score, axis=0)[np.newaxis]
+    block = np.take_along_axis(values, best, axis=0)[0]
+    block[~valid.any(axis=0)] = np.nan
+    return block
+
+
+def write_streaming_mosaic(band_sources, output_file, target_crs, block_size=1024, cog=False,
+                           encoding=None, method="first", scl_sources=None, ndvi_sources=None,
+                           on_block=None):
+    """
+    Mosaics single-band rasters block by block straight into output_file.
+    Every input is read onto the mosaic grid in target_crs (see mosaic_source), and for each
+    output block only the inputs that overlap it are read, and only over that window.
+    Overlapping inputs are combined with composite_block; with the default method the first
+    input with a valid (non-NaN, non-zero) pixel wins, as with merge_arrays. The other methods
+    also read each scene's SCL and NDVI over the same window.
+    Peak memory is roughly one block per input rather than several full mosaics.
+
+    Parameters:
+    band_sources (list): The (path, band index) of each raster to mosaic (see find_band_sources).
+    output_file (str): Path of the mosaic GeoTIFF to write.
+    target_crs (str): The Coordinate Reference System of the mosaic.
+    block_size (int, optional): The width and height of the blocks in pixels. Defaults to 1024.
+    cog (bool, optional): Write a Cloud Optimized GeoTIFF with overviews (see cog_output).
+    encoding (dict, optional): A scaled-integer encoding such as NDVI_INT16 to store the
+        mosaic with instead of float32.
+    method (str, optional): How overlapping inputs are combined, one of COMPOSITE_METHODS.
+        Defaults to "first".
+    scl_sources (list, optional): The (path, band index) of the SCL of each input's scene,
+        or None where a scene has no SCL. Required by every method but "first".
+    ndvi_sources (list, optional): The (path, band index) of the NDVI of each input's scene,
+        or None where a scene has no NDVI. Used by "max_ndvi".
+    on_block (callable, optional): Called with every block as it is written, as float values
+        with NaN nodata (decoded from the encoding, if any), e.g. to gather statistics
+        without reading the mosaic again.
+    """
+    with ExitStack() as stack:
+        output_file = stack.enter_context(cog_output(output_file, cog))
+        datasets = [stack.enter_context(rasterio.open(file))
+                    for file, _ in band_sources]
+        transform, width, height = mosaic_grid(datasets, target_crs)
+
+        sources = [mosaic_source(ds, target_crs, transform, width, height, stack, bidx)
+                   for ds, (_, bidx) in zip(datasets, band_sources)]
+
+        def scene_layer(layer_sources):
+            # Reads each scene's layer on the mosaic grid, all NaN for scenes without it
+            reads = []
+            for source in layer_sources or [None] * len(sources):
+                if source is None:
+                    reads.append(lambda window: np.full(
+                        (window.height, window.width), np.nan, dtype='float32'))
+                    continue
+                file, bidx = source
+                ds = stack.enter_context(rasterio.open(file))
+                reads.append(mosaic_source(
+                    ds, target_crs, transform, width, height, stack, bidx)[0])
+            return reads
+
+        scl_reads = scene_layer(scl_sources) if method != "first" else None
+        ndvi_reads = scene_layer(ndvi_sources) if method == "max_ndvi" else None
+
+        profile = dict(GTIFF_OPTIONS, width=width, height=height, count=1, dtype='float32',
+                       crs=target_crs, transform=transform, nodata=np.nan,
+                       photometric='MINISBLACK')
+        if encoding is not None:
+            profile.update(dtype=encoding["dtype"], nodata=encoding["nodata"])
+        with rasterio.open(output_file, 'w', **profile) as dst:
+            if encoding is not None:
+                dst.scales = (encoding["scale"],)
+                dst.offsets = (encoding["offset"],)
+            for window in block_windows(width, height, block_size):
+                overlapping = [i for i, (_, footprint) in enumerate(sources)
+                               if rasterio.windows.intersect(window, footprint)]
+                if not overlapping:
+                    block = np.full((window.height, window.width), np.nan, dtype='float32')
+                else:
+                    values = np.stack([sources[i][0](window) for i in overlapping])
+                    scl = ndvi = None
+                    if scl_reads is not None:
+                        scl = np.stack([scl_reads[i](window) for i in overlapping])
+                    if ndvi_reads is not None:
+                        ndvi = np.stack([ndvi_reads[i](window) for i in overlapping])
+                    block = composite_block(values, method, scl, ndvi)
+                if encoding is not None:
+                    block = encode_block(block, encoding)
+                dst.write(block, 1, window=window)
+                if on_block is not None:
+                    on_block(block if encoding is None else decode_block(block, encoding))
+
+
+def create_mosaic(band_name, output_path, target_crs="EPSG:32611", streaming=True, block_size=1024,
+                  cog=False, encoding=None, method="first", on_block=None):
     """
     Gathers all raster files matching band_name in output_path,
     merges them, reprojects to target_crs if needed,
@@ -279,16 +1017,46 @@ def create_mosaic(band_name, output_path, target_crs="EPSG:32611"):
     band_name (str): The name of the band to be used for file matching.
     output_path (str): The directory where the raster files are located.
     target_crs (str, optional): The target Coordinate Reference System for reprojection. Defaults to "EPSG:32611".
+    streaming (bool, optional): Write the mosaic block by block with write_streaming_mosaic instead of
+        merging the full rasters in memory. Defaults to True.
+    block_size (int, optional): The block size in pixels used when streaming. Defaults to 1024.
+    cog (bool, optional): Write the streamed mosaic as a Cloud Optimized GeoTIFF with overviews.
+    encoding (dict, optional): A scaled-integer encoding such as NDVI_INT16 to store the
+        mosaic with instead of float32.
+    method (str, optional): How overlapping scenes are combined when streaming, one of
+        COMPOSITE_METHODS (see composite_block). Defaults to "first". Scenes are paired with
+        their own SCL and NDVI rasters in output_path.
+    on_block (callable, optional): Called with every block of the mosaic as it is written
+        when streaming (see write_streaming_mosaic).
     """
-    band_files = glob.glob(f"{output_path}/{band_name}_*.tif")
-    if not band_files:
-        print(f"No {band_name} raster files found in {
-              output_path}. Mosaic not created.")
+    scenes = find_scene_sources(band_name, output_path)
+    scene_ids = sorted(scenes)
+    band_sources = [scenes[scene_id] for scene_id in scene_ids]
+    if not band_sources:
+        print(f"No {band_name} raster files found in {output_path}. "
+              "Mosaic not created.")
+        return
+
+    if streaming:
+        # The median of scene classes is meaningless, so SCL takes the least cloudy class
+        if band_name == "SCL" and method == "median":
+            method = "least_cloud"
+        scl_sources = ndvi_sources = None
+        if method != "first":
+            scl = find_scene_sources("SCL", output_path)
+            ndvi = find_scene_sources("NDVI", output_path)
+            scl_sources = [scl.get(scene_id) for scene_id in scene_ids]
+            ndvi_sources = [ndvi.get(scene_id) for scene_id in scene_ids]
+
+        output_file = f"{output_path}/{band_name}_mosaic.tif"
+        write_streaming_mosaic(band_sources, output_file, target_crs, block_size, cog,
+                               encoding, method, scl_sources, ndvi_sources, on_block)
+        print(f"Saved {band_name} raster to {output_file}")
         return
 
     # Open all the rasters into a list
     raster_list = [rioxarray.open_rasterio(
-        file, chunks={"x": 1024, "y": 1024}) for file in band_files]
+        file, chunks={"x": 1024, "y": 1024}, lock=False).sel(band=[bidx]) for file, bidx in band_sources]
 
     # Merge the rasters
     mosaic = merge_arrays(raster_list)
@@ -303,91 +1071,95 @@ def create_mosaic(band_name, output_path, target_crs="EPSG:32611"):
     mosaic = mosaic.rio.reproject(target_crs)
 
     # Save the final mosaic
-    save_raster(mosaic, band_name, "mosaic", output_path)
+    save_raster(mosaic, band_name, "mosaic", output_path, encoding)
 
 
-def rescale_band(band, scl_band=None, cloud_values=[3, 8, 9, 10, 11]):
+def stretch_block(block, low, high):
     """
-    Rescales a band to 0-255 for visualization, excluding cloud, snow, and shadow pixels 
-    if an SCL band is provided.
-
-    Parameters:
-        band (rioxarray.DataArray): The input band to rescale.
-        scl_band (rioxarray.DataArray, optional): The scene classification layer used to mask out cloud pixels.
-        cloud_values (list): List of SCL values representing clouds, snow, or shadows.
-
-    Returns:
-        rioxarray.DataArray: The rescaled band as an 8-bit unsigned integer array.
+    Rescales a block to 0-255 between the low and high values for visualization.
+    Values outside the range are clipped, and NaN pixels become 0 (nodata).
     """
-    if scl_band is not None:
-        # Resample the SCL band to match the resolution of the target band
-        scl_resampled = scl_band.rio.reproject_match(band)
-
-        # Create a mask: True for pixels NOT matching any cloud value
-        mask = ~np.isin(scl_resampled.values, cloud_values)
-
-        # Apply the mask to the band
-        band_masked = band.where(mask, np.nan)
-
-        # Extract valid pixels (non-cloud, non-shadow, etc.)
-        valid_pixels = band_masked.values[~np.isnan(band_masked.values)]
-    else:
-        valid_pixels = band.values
+    stretched = np.clip((block - low) / (high - low) * 255, 0, 255)
+    stretched[np.isnan(block)] = 0
+    return stretched.astype(np.uint8)
 
-    # Compute the 0.1th and 99.9th percentiles on valid (non-cloud) pixels
-    p1, p99 = np.percentile(valid_pixels, [0.1, 99.9])
 
-    if p99 - p1 == 0:
-        raise ValueError(
-            "p99 - p1 is zero. Rescaling will produce NaN values.")
-
-    # Apply linear rescaling
-    band_rescaled = (band - p1) / (p99 - p1) * 255
-
-    # Clip values to the valid range and replace NaN with 0
-    band_rescaled = band_rescaled.clip(0, 255).where(~np.isnan(band), 0)
-
-    return band_rescaled.astype(np.uint8)
-
-
-def combine_rgb_layers(output_path, scl_mosaic):
+def combine_rgb_layers(output_path, scl_path=None, cloud_values=CLOUD_VALUES, block_size=1024,
+                       cog=False):
     """
     Combines the red, green, and blue mosaic bands into a single multi-band raster and saves it.
-    Uses the provided SCL mosaic to exclude cloud pixels during the rescaling process.
+    Each band is stretched to 0-255 between its 0.1th and 99.9th percentiles, excluding cloud,
+    snow, and shadow pixels of the SCL mosaic.
+
+    The mosaics are streamed block by block in two passes. The first pass builds the cloud mask
+    once per block, shares it across the three bands, and collects a unit-bin histogram of each
+    band's reflectance values, from which the percentiles are read. The second pass writes the
+    stretched uint8 blocks straight to the output, so memory stays at a few blocks.
 
     Parameters:
         output_path (str): The directory where the mosaic raster files are located.
-        scl_mosaic (rioxarray.DataArray): The mosaic SCL band used for cloud masking.
+        scl_path (str, optional): Path of the SCL mosaic used for cloud masking.
+        cloud_values (list): List of SCL values representing clouds, snow, or shadows.
+        block_size (int, optional): The width and height of the blocks in pixels. Defaults to 1024.
+        cog (bool, optional): Write a Cloud Optimized GeoTIFF with overviews (see cog_output).
     """
-    # Open each mosaic band.
-    red = rioxarray.open_rasterio(
-        f"{output_path}/red_mosaic.tif", chunks={"x": 1024, "y": 1024})
-    green = rioxarray.open_rasterio(
-        f"{output_path}/green_mosaic.tif", chunks={"x": 1024, "y": 1024})
-    blue = rioxarray.open_rasterio(
-        f"{output_path}/blue_mosaic.tif", chunks={"x": 1024, "y": 1024})
-
-    # Ensure all bands are aligned
-    red, green, blue = xr.align(red, green, blue)
-
-    # Rescale each band to 0-255 using the provided SCL mosaic for masking.
-    red = rescale_band(red, scl_mosaic)
-    green = rescale_band(green, scl_mosaic)
-    blue = rescale_band(blue, scl_mosaic)
-
-    # Stack the rescaled bands into a single multi-band raster.
-    rgb_mosaic = xr.concat([red, green, blue], dim="band")
-
-    # Set the NoData value explicitly for all bands.
-    rgb_mosaic.rio.write_nodata(0, inplace=True)
-
-    # Save the RGB mosaic.
-    save_raster(rgb_mosaic, "RGB", "mosaic", output_path)
+    output_file = f"{output_path}/RGB_mosaic.tif"
+    with ExitStack() as stack:
+        bands = [stack.enter_context(rasterio.open(f"{output_path}/{band}_mosaic.tif"))
+                 for band in ("red", "green", "blue")]
+        red = bands[0]
+        if any(band.shape != red.shape or not band.transform.almost_equals(red.transform)
+               for band in bands):
+            raise ValueError("The red, green and blue mosaics are not on the same grid.")
+
+        # Read the SCL mosaic on the grid of the RGB bands
+        read_scl = None
+        if scl_path is not None:
+            scl = stack.enter_context(rasterio.open(scl_path))
+            read_scl, _ = mosaic_source(scl, red.crs, red.transform,
+                                        red.width, red.height, stack)
+
+        windows = list(block_windows(red.width, red.height, block_size))
+
+        # Pass 1: histogram of the valid (non-cloud) pixels of each band.
+        # Reflectances are integers stored as float32, so unit bins over the uint16 range are exact.
+        histograms = np.zeros((3, 65536), dtype=np.int64)
+        for window in windows:
+            clear = None
+            if read_scl is not None:
+                clear = ~np.isin(read_scl(window), cloud_values)
+            for i, band in enumerate(bands):
+                data = band.read(1, window=window)
+                valid = ~np.isnan(data) if clear is None else clear & ~np.isnan(data)
+                values = np.clip(data[valid], 0, 65535).astype(np.int64)
+                histograms[i] += np.bincount(values, minlength=65536)
+
+        # Compute the 0.1th and 99.9th percentiles on valid (non-cloud) pixels
+        limits = [histogram_percentiles(counts, [0.1, 99.9])
+                  for counts in histograms]
+        for p1, p99 in limits:
+            if p99 - p1 == 0:
+                raise ValueError(
+                    "p99 - p1 is zero. Rescaling will produce NaN values.")
+
+        # Pass 2: stretch each block and write it straight to the RGB mosaic
+        profile = dict(GTIFF_OPTIONS, width=red.width, height=red.height, count=3,
+                       dtype='uint8', crs=red.crs, transform=red.transform, nodata=0,
+                       photometric='RGB')
+        with rasterio.open(stack.enter_context(cog_output(output_file, cog)), 'w',
+                           **profile) as dst:
+            for window in windows:
+                for i, (band, (p1, p99)) in enumerate(zip(bands, limits)):
+                    block = band.read(1, window=window)
+                    dst.write(stretch_block(block, p1, p99), i + 1, window=window)
+    print(f"Saved RGB raster to {output_file}")
 
 
 def add_overviews(raster_path, overview_factors=[2, 4, 8, 16, 32], resampling_method=Resampling.average):
     """
     Adds overviews (pyramids) to an existing raster for faster rendering in web applications.
+    The pipeline now writes its mosaics as COGs with internal overviews (see cog_output);
+    this is kept for rasters written without them.
 
     Parameters:
     raster_path (str): Path to the raster file.
@@ -401,25 +1173,266 @@ def add_overviews(raster_path, overview_factors=[2, 4, 8, 16, 32], resampling_me
         # Update tags to record overview information
         src.update_tags(ns='rio_overview', resampling=resampling_method.name)
 
-    print(f"Overviews added to {raster_path} using {
-          resampling_method.name} resampling.")
+    print(f"Overviews added to {raster_path} using "
+          f"{resampling_method.name} resampling.")
 # ------------------------------------------------------------------------------
 # 6. Main Workflow
 # ------------------------------------------------------------------------------
 
 
-def process_date(date_str, geometry, geometry_utm, collection, client):
+def scene_output_files(scene_id, output_path, stacked=False):
+    """
+    Returns the paths of the rasters process_scene writes for a scene.
+    """
+    if stacked:
+        return [f"{output_path}/stack_{scene_id}.tif"]
+    return [f"{output_path}/{band}_{scene_id}.tif"
+            for band in list(SCENE_BANDS.values()) + ["NDVI"]]
+
+
+def geometry_digest(geometry):
+    """
+    Returns the SHA-256 digest of a clip geometry, from its CRS and the WKB of its union,
+    so the manifest can tell outputs clipped to another county or simplification apart.
+    """
+    digest = hashlib.sha256(geometry.crs.to_wkt().encode())
+    digest.update(geometry.union_all().wkb)
+    return digest.hexdigest()
+
+
+def scene_inputs(scene, target_grid=None, stacked=False, clip_geometry=None):
+    """
+    Describes everything a scene's outputs depend on, for the manifest:
+    the STAC item id, the asset hrefs, the pipeline version, the target grid,
+    the clip geometry (see geometry_digest) and whether the scene is written as a stack.
+    """
+    inputs = {"item_id": scene.id,
+              "assets": {key: scene.assets[key].href for key in SCENE_ASSETS},
+              "pipeline_version": PIPELINE_VERSION,
+              "target_grid": target_grid}
+    if clip_geometry is not None:
+        inputs["clip"] = geometry_digest(clip_geometry)
+    # Only recorded for stacks, so scenes processed before stacks existed stay current
+    if stacked:
+        inputs["stacked"] = True
+    return inputs
+
+
+def process_scene(scene, geometry_utm, output_path, target_grid=None, manifest=None,
+                  stacked=False):
+    """
+    Clips and saves the Red, Green, Blue and SCL bands of one STAC scene,
+    then computes and saves its NDVI.
+    With stacked, the five layers are saved together as one band-interleaved GeoTIFF (see save_scene_stack)
+    instead of one GeoTIFF each, with SCL resampled to the 10 m grid of the other bands.
+
+    Parameters:
+    scene (pystac.Item): A STAC scene containing assets.
+    geometry_utm (geopandas.GeoDataFrame): The geometry to clip the bands to in UTM projection.
+    output_path (str): The directory where the scene rasters will be saved.
+    target_grid (dict, optional): A grid from build_target_grid to warp the bands onto.
+    manifest (dict, optional): A manifest from pipeline_manifest.load_manifest. When given, a scene
+        whose inputs and outputs are unchanged since the last run is skipped.
+    stacked (bool, optional): Save a single per-scene stack instead of one file per band.
+    """
+    scene_key = f"{output_path}/{scene.id}"
+    inputs = scene_inputs(scene, target_grid, stacked, geometry_utm)
+    if manifest is not None and scene_is_current(manifest, scene_key, inputs):
+        print(f"Scene {scene.id} is up to date, skipping")
+        return
+
+    print(f"Processing scene ID: {scene.id}")
+
+    # Fetch, reproject and clip every asset once for all products
+    bands = load_scene_bands(scene, geometry_utm, target_grid=target_grid)
+
+    if not stacked:
+        for asset_key, band_name in SCENE_BANDS.items():
+            save_raster(bands[asset_key], band_name, scene.id, output_path)
+
+    red_band_masked, nir_band_masked = clip_and_mask_bands(
+        scene, geometry_utm, bands)
+
+    ndvi = compute_ndvi(red_band_masked, nir_band_masked)
+    ndvi = ndvi.rio.clip(
+        geometry_utm.geometry.tolist(), crs=geometry_utm.crs)
+
+    if stacked:
+        # Bring SCL and the clipped NDVI onto the Red grid so every layer shares one transform
+        red = bands["red"]
+        layers = {band_name: bands[asset_key]
+                  for asset_key, band_name in SCENE_BANDS.items()}
+        layers["SCL"] = bands["scl"].rio.reproject_match(red, resampling=Resampling.nearest)
+        # NDVI has no nodata set, so without NaN nodata reproject_match fills the area
+        # outside the clip with 0 instead of NaN
+        layers["NDVI"] = ndvi.rio.write_nodata(np.nan).rio.reproject_match(
+            red, resampling=Resampling.nearest)
+        save_scene_stack(layers, scene.id, output_path)
+    else:
+        save_raster(ndvi, 'NDVI', scene.id, output_path)
+
+    for band in bands.values():
+        band.close()
+    red_band_masked.close()
+    nir_band_masked.close()
+    ndvi.close()
+
+    if manifest is not None:
+        record_scene(manifest, scene_key, inputs,
+                     scene_output_files(scene.id, output_path, stacked))
+
+
+def process_scenes(items, geometry_utm, output_path, scene_workers=4, scene_slots=None,
+                   target_grid=None, manifest=None, stacked=False):
+    """
+    Runs process_scene for every scene of a date on a bounded thread pool.
+    Scenes are independent of each other, and GDAL releases the GIL while reading
+    and warping, so threads overlap the remote reads of one scene with the warping
+    of another. At most scene_workers scenes are held in memory at once.
+    Returns only after every scene has finished and re-raises the first failure.
+
+    Parameters:
+    items (pystac.ItemCollection): The scenes to process.
+    geometry_utm (geopandas.GeoDataFrame): The geometry to clip the bands to in UTM projection.
+    output_path (str): The directory where the scene rasters will be saved.
+    scene_workers (int, optional): The maximum number of scenes processed at once. Defaults to 4.
+    scene_slots (threading.Semaphore, optional): A slot shared by several dates that each scene
+        must hold while it runs, capping the scenes in memory across the whole run.
+    target_grid (dict, optional): A grid from build_target_grid to warp the bands onto.
+    manifest (dict, optional): A manifest used to skip scenes that are already up to date.
+    stacked (bool, optional): Save each scene as a single multi-band stack (see process_scene).
+    """
+    def run_scene(scene):
+        with scene_slots or nullcontext():
+            process_scene(scene, geometry_utm, output_path, target_grid, manifest, stacked)
+
+    if scene_workers <= 1:
+        for scene in items:
+            run_scene(scene)
+        return
+
+    with ThreadPoolExecutor(max_workers=scene_workers) as executor:
+        futures = [executor.submit(run_scene, scene) for scene in items]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except Exception:
+            # Don't start scenes that are still queued once one has failed
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def build_date_products(output_path, mosaic_crs, manifest=None, ndvi_encoding=NDVI_INT16,
+                        composite="least_cloud", clip=None):
+    """
+    Creates the band mosaics and the RGB composite of a date from its per-scene rasters,
+    as Cloud Optimized GeoTIFFs with internal overviews. With a manifest, a product is rebuilt only when the files it is
+    built from changed since the last run (or it is missing).
+    The NDVI statistics, histogram and SCL class counts of the date are gathered while the NDVI
+    and SCL mosaics are written and saved next to them as summary.json (see ndvi_stats), so the
+    analytics never read the mosaics again.
+
+    Parameters:
+    output_path (str): The directory of the date's rasters.
+    mosaic_crs (str): The Coordinate Reference System of the mosaics.
+    manifest (dict, optional): A manifest from pipeline_manifest.load_manifest.
+    ndvi_encoding (dict, optional): The encoding of the NDVI mosaic. Defaults to NDVI_INT16,
+        which halves its size; None keeps float32.
+    composite (str, optional): How overlapping scenes are combined, one of COMPOSITE_METHODS.
+        Defaults to "least_cloud", so a clear pixel from one scene wins over a cloudy one
+        from another.
+    clip (str, optional): The geometry_digest of the clip geometry of the scenes, recorded
+        with the products so a new clip rebuilds them.
+    """
+    options = {"pipeline_version": PIPELINE_VERSION, "crs": mosaic_crs, "cog": True,
+               "ndvi_encoding": ndvi_encoding, "composite": composite, "clip": clip}
+
+    # Every method but "first" also reads each scene's SCL and NDVI
+    composite_inputs = []
+    if composite != "first":
+        composite_inputs = [file for band in ("SCL", "NDVI")
+                            for file, _ in find_band_sources(band, output_path)]
+
+    def is_current(output_file, input_files):
+        return manifest is not None and product_is_current(
+            manifest, output_file, input_files, options)
+
+    # Products rebuilt in this run, with the files each one was built from
+    rebuilt = {}
+
+    # Statistics of the NDVI and SCL mosaics, gathered block by block as they are written
+    accumulator = empty_accumulator()
+    summary_blocks = {"NDVI": add_ndvi_block, "SCL": add_scl_block}
+
+    for band in MOSAIC_BANDS:
+        band_files = [file for file, _ in find_band_sources(band, output_path)]
+        band_files = sorted(set(band_files + composite_inputs))
+        mosaic_file = f"{output_path}/{band}_mosaic.tif"
+        if not is_current(mosaic_file, band_files):
+            on_block = None
+            if band in summary_blocks:
+                on_block = partial(summary_blocks[band], accumulator)
+            create_mosaic(band, output_path, target_crs=mosaic_crs, cog=True,
+                          encoding=ndvi_encoding if band == "NDVI" else None,
+                          method=composite, on_block=on_block)
+            rebuilt[mosaic_file] = band_files
+
+    ndvi_file = f"{output_path}/NDVI_mosaic.tif"
+    scl_file = f"{output_path}/SCL_mosaic.tif"
+    if os.path.exists(ndvi_file) and os.path.exists(scl_file):
+        if {ndvi_file, scl_file} <= rebuilt.keys():
+            with rasterio.open(ndvi_file) as ndvi_src, rasterio.open(scl_file) as scl_src:
+                weight = pixel_weight(ndvi_src, scl_src)
+            save_summary(finish_summary(accumulator, weight), output_path)
+        elif {ndvi_file, scl_file} & rebuilt.keys() or load_summary(output_path) is None:
+            # Only one of the two mosaics was written in this run, or the sidecar is missing
+            save_summary(date_summary(output_path), output_path)
+
+    rgb_file = f"{output_path}/RGB_mosaic.tif"
+    rgb_inputs = [f"{output_path}/{band}_mosaic.tif"
+                  for band in ("red", "green", "blue", "SCL")]
+    if set(rgb_inputs) & rebuilt.keys() or not is_current(rgb_file, rgb_inputs):
+        combine_rgb_layers(output_path, f"{output_path}/SCL_mosaic.tif", cog=True)
+        rebuilt[rgb_file] = rgb_inputs
+
+    # Mosaics come first so the RGB composite can reference their checksums.
+    if manifest is not None:
+        for output_file, input_files in rebuilt.items():
+            if os.path.exists(output_file):
+                record_product(manifest, output_file, input_files, options)
+
+
+def process_date(date_str, geometry, geometry_utm, collection, client, scene_workers=4,
+                 scene_slots=None, target_grid=None, items=None, manifest=None, stacked=False,
+                 publisher=None, ndvi_encoding=NDVI_INT16, store_path=None):
     """
     Searches for Sentinel-2 scenes for the given date,
-    processes them by computing and saving NDVI,
-    then calls create_mosaic.
+    processes them concurrently by computing and saving NDVI,
+    then calls create_mosaic once every scene has finished.
+
+    scene_workers and scene_slots set how many scenes are processed at once (see process_scenes).
+    With a target_grid from build_target_grid, every band is warped once onto that grid and the
+    mosaics are written in the grid's CRS; otherwise scenes are warped to UTM and the mosaics
+    reprojected to Web Mercator.
+    The STAC search is skipped when the date's items were already found by search_sentinel_season.
+    With a manifest, up-to-date scenes are skipped and only the mosaics whose inputs changed are
+    rebuilt (see build_date_products).
+    With stacked, each scene is saved as one multi-band stack that the mosaics read their bands from.
+    With a publisher from upload_to_DO.start_publisher, the RGB and NDVI mosaics are queued for
+    upload in the background once they are written.
+    ndvi_encoding sets how the NDVI mosaic is stored (see build_date_products); None keeps float32.
+    With a store_path, the date's statistics and histogram are upserted into that analytics store
+    (see ndvi_stats.store_date) once its mosaics are written.
+    Returns the number of scenes processed, or 0 when no scenes were found.
     """
-    items = search_sentinel_scenes(date_str, geometry, collection, client)
+    if items is None:
+        items = search_sentinel_scenes(date_str, geometry, collection, client)
     if not items:
-        return  # No scenes to process for this date
+        return 0  # No scenes to process for this date
 
     # Parse date components for output folder naming
-    date_obj = dt.datetime.strptime(date_str, "%Y-%m-%d")
+    date_obj = dt.strptime(date_str, "%Y-%m-%d")
     month = date_obj.strftime("%B")
     day = date_obj.strftime("%d")
 
@@ -427,64 +1440,118 @@ def process_date(date_str, geometry, geometry_utm, collection, client):
     output_path = f"historic_rasters/2024/{month}/{day}"
     os.makedirs(output_path, exist_ok=True)
 
-    # Process each scene
-    for scene in items:
-        print(f"Processing scene ID: {scene.id}")
+    # Process the scenes concurrently; mosaicking waits for all of them
+    process_scenes(items, geometry_utm, output_path,
+                   scene_workers, scene_slots, target_grid, manifest, stacked)
 
-        red_band = clip_band(scene.assets['red'].href, geometry_utm)
-        save_raster(red_band, 'red', scene.id, output_path)
-        red_band.close()
-        del red_band
+    # Changes final mosaic to Web Mercator, unless the scenes are already on the target grid
+    mosaic_crs = target_grid["crs"] if target_grid else "EPSG:3857"
 
-        blue_band = clip_band(scene.assets['blue'].href, geometry_utm)
-        save_raster(blue_band, 'blue', scene.id, output_path)
-        blue_band.close()
-        del blue_band
+    # After all scenes are processed, create the mosaics
+    build_date_products(output_path, mosaic_crs, manifest, ndvi_encoding,
+                        clip=geometry_digest(geometry_utm))
 
-        green_band = clip_band(scene.assets['green'].href, geometry_utm)
-        save_raster(green_band, 'green', scene.id, output_path)
-        green_band.close()
-        del green_band
+    if manifest is not None:
+        save_manifest(manifest)
 
-        scl_band = clip_band(scene.assets['scl'].href, geometry_utm)
-        save_raster(scl_band, 'SCL', scene.id, output_path)
-        scl_band.close()
-        del scl_band
+    if store_path is not None:
+        store_date(date_str, output_path, store_path)
 
-        red_band_masked, nir_band_masked = clip_and_mask_bands(
-            scene, geometry_utm)
+    # Upload the mosaics in the background while the next dates are processed
+    if publisher is not None:
+        publish(publisher, [f"{output_path}/RGB_mosaic.tif",
+                            f"{output_path}/NDVI_mosaic.tif"], date_str)
 
-        ndvi = compute_ndvi(red_band_masked, nir_band_masked)
-        ndvi = ndvi.rio.clip(
-            geometry_utm.geometry.tolist(), crs=geometry_utm.crs)
+    return len(items)
 
-        save_raster(ndvi, 'NDVI', scene.id, output_path)
 
-        red_band_masked.close()
-        nir_band_masked.close()
-        ndvi.close()
-        del red_band_masked, nir_band_masked, ndvi  # Delete the bands to free memory
+def process_dates(dates, geometry, geometry_utm, collection, client,
+                  date_workers=3, scene_workers=4, max_scenes_in_flight=8, target_grid=None,
+                  scenes_by_date=None, manifest=None, stacked=False, publisher=None,
+                  ndvi_encoding=NDVI_INT16, store_path=None):
+    """
+    Runs process_date for several dates concurrently.
+    While one date waits on its STAC search and remote reads, another can be warping
+    and mosaicking. A date that fails is reported and the remaining dates continue.
 
-    # After all scenes are processed, create a mosaic
-    create_mosaic("NDVI", output_path, target_crs="EPSG:3857")
-    # Changes final mosaic to Web Mercator
-    create_mosaic("red", output_path, target_crs="EPSG:3857")
-    create_mosaic("green", output_path, target_crs="EPSG:3857")
-    create_mosaic("blue", output_path, target_crs="EPSG:3857")
-    create_mosaic("SCL", output_path, target_crs="EPSG:3857")
+    Parameters:
+    dates (list): Dates to process as YYYY-MM-DD strings.
+    geometry (geopandas.GeoDataFrame): The county geometry used for the STAC search.
+    geometry_utm (geopandas.GeoDataFrame): The geometry to clip the bands to in UTM projection.
+    collection (str): The STAC collection to search.
+    client (pystac_client.Client): The STAC client.
+    date_workers (int, optional): The maximum number of dates processed at once. Defaults to 3.
+    scene_workers (int, optional): The maximum number of scenes processed at once per date. Defaults to 4.
+    max_scenes_in_flight (int, optional): The global cap on scenes processed at once across all
+        dates. Each scene holds its clipped bands in memory, so this also bounds peak memory. Defaults to 8.
+    target_grid (dict, optional): A grid from build_target_grid to warp the bands onto.
+    scenes_by_date (dict, optional): The scenes of each date from search_sentinel_season.
+        When given, dates are not searched one by one.
+    manifest (dict, optional): A manifest from pipeline_manifest.load_manifest used to skip
+        scenes and mosaics that are already up to date.
+    stacked (bool, optional): Save each scene as a single multi-band stack instead of one
+        GeoTIFF per band. Defaults to False.
+    publisher (dict, optional): A publisher from upload_to_DO.start_publisher. Each date's
+        mosaics are uploaded by it in the background; flush it once the run is over.
+    ndvi_encoding (dict, optional): The encoding of the NDVI mosaics. Defaults to NDVI_INT16,
+        which halves their size; None keeps float32.
+    store_path (str, optional): The analytics store each date is upserted into once its mosaics
+        are written. Defaults to None, which leaves the store to ndvi_stats.build_analytics.
 
-    scl_mosaic = rioxarray.open_rasterio(
-        f"{output_path}/SCL_mosaic.tif", chunks={"x": 1024, "y": 1024})
-    combine_rgb_layers(output_path, scl_mosaic)
+    Returns:
+    dict: Per-date results with the number of scenes, elapsed seconds and any error.
+    """
+    scene_slots = threading.BoundedSemaphore(max_scenes_in_flight)
+    results = {}
+    run_start = time.perf_counter()
+
+    def run_date(date_str):
+        date_start = time.perf_counter()
+        items = None if scenes_by_date is None else scenes_by_date.get(date_str, [])
+        scenes = process_date(date_str, geometry, geometry_utm, collection, client,
+                              scene_workers, scene_slots, target_grid, items, manifest,
+                              stacked, publisher, ndvi_encoding, store_path)
+        return scenes, time.perf_counter() - date_start
+
+    with ThreadPoolExecutor(max_workers=date_workers) as executor:
+        futures = {executor.submit(run_date, date_str): date_str for date_str in dates}
+        for future in as_completed(futures):
+            date_str = futures[future]
+            try:
+                scenes, seconds = future.result()
+                results[date_str] = {"scenes": scenes, "seconds": seconds, "error": None}
+                status = f"{scenes} scenes in {seconds:.1f}s"
+            except Exception as e:
+                results[date_str] = {"scenes": 0, "seconds": None, "error": str(e)}
+                status = f"failed: {e}"
+            print(f"[{len(results)}/{len(dates)}] {date_str}: {status}")
+
+    report_progress(results, time.perf_counter() - run_start)
+    return results
+
+
+def report_progress(results, elapsed):
+    """
+    Prints a summary of a multi-date run: dates processed, skipped and failed,
+    scenes processed and the overall throughput.
 
-    add_overviews(f"{output_path}/RGB_mosaic.tif")
-    add_overviews(f"{output_path}/NDVI_mosaic.tif")
-    add_overviews(f"{output_path}/SCL_mosaic.tif")
+    Parameters:
+    results (dict): The per-date results returned by process_dates.
+    elapsed (float): The wall-clock time of the run in seconds.
+    """
+    processed = [r for r in results.values() if r["error"] is None and r["scenes"]]
+    skipped = [r for r in results.values() if r["error"] is None and not r["scenes"]]
+    failed = sorted(d for d, r in results.items() if r["error"] is not None)
+    scenes = sum(r["scenes"] for r in processed)
+    hours = elapsed / 3600
 
-    # # Uncomment this chunk to upload the mosaics to the S3 cloud bucket
-    # client, BUCKET_NAME = connect_s3_client()
-    # upload_image_to_s3(client, BUCKET_NAME, f"{output_path}/RGB_mosaic.tif", date_str)
-    # upload_image_to_s3(client, BUCKET_NAME, f"{output_path}/NDVI_mosaic.tif", date_str)
+    print(f"Processed {len(processed)} dates ({scenes} scenes) in {elapsed / 60:.1f} min; "
+          f"{len(skipped)} dates had no scenes, {len(failed)} failed.")
+    if hours > 0:
+        print(f"Throughput: {len(processed) / hours:.1f} dates/hour, "
+              f"{scenes / hours:.1f} scenes/hour")
+    if failed:
+        print(f"Failed dates: {', '.join(failed)}")
 
 
 def main():
@@ -492,7 +1559,7 @@ def main():
     working_directory = "/Volumes/Drew_ext_drive/NDVI_Proj"
     setup_environment(working_directory)
 
-    geometry, geometry_utm = load_county_geometry('063')
+    geometry, geometry_utm = load_county_geometry('063', simplify_tolerance=10)
 
     # 2. Initialize STAC client
     api_url = "https://earth-search.aws.element84.com/v1"
@@ -501,8 +1568,8 @@ def main():
     collection = "sentinel-2-l2a"
 
     # 3. Specify the target dates
-    start_date = datetime(2024, 10, 3)  # April 1, 2024
-    end_date = datetime(2024, 10, 31)  # June 31, 2024
+    start_date = dt(2024, 10, 3)  # April 1, 2024
+    end_date = dt(2024, 10, 31)  # June 31, 2024
     delta = timedelta(days=1)
 
     # # Include all dates from April-October 2024
@@ -510,9 +1577,33 @@ def main():
              for i in range((end_date - start_date).days + 1)]
     # dates = ['2024-06-09']
 
-    # 4. Process each date
-    for date_str in dates:
-        process_date(date_str, geometry, geometry_utm, collection, client)
+    # 4. Find the scenes of every date with one cached STAC search
+    scenes_by_date = search_sentinel_season(
+        dates[0], dates[-1], geometry, collection, client)
+
+    # 5. Warp every scene once onto a shared Web Mercator grid
+    target_grid = build_target_grid(geometry_utm, "EPSG:3857")
+
+    # 6. Optionally upload each date's mosaics to the S3 cloud bucket while later dates run
+    upload = False
+    publisher = start_publisher(*get_s3_client()) if upload else None
+
+    # 7. Process the dates, several at a time, skipping outputs that are up to date.
+    # NDVI mosaics are stored as scaled int16; set ndvi_encoding to None to keep float32
+    ndvi_encoding = NDVI_INT16
+    manifest = load_manifest("historic_rasters/manifest.json")
+    # Each date is added to the application's analytics store as soon as it is processed
+    store_path = STORE_FILE
+    process_dates(dates, geometry, geometry_utm, collection, client,
+                  date_workers=3, scene_workers=4, max_scenes_in_flight=8,
+                  target_grid=target_grid, scenes_by_date=scenes_by_date,
+                  manifest=manifest, publisher=publisher, ndvi_encoding=ndvi_encoding,
+                  store_path=store_path)
+
+    # 8. Wait for the last uploads and report them
+    if publisher is not None:
+        flush_publisher(publisher)
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,540 @@
+"""
+This module computes the per-date NDVI statistics used by the application by streaming the
+NDVI and SCL mosaics block by block, so memory stays constant per date whatever the size of
+the area of interest.
+
+1. **NDVI moments**: the count, mean and standard deviation of the valid NDVI pixels are
+   accumulated per block and merged with the parallel variance formula, which stays accurate
+   over hundreds of millions of pixels.
+2. **SCL class counts**: the pixels of each scene class are counted on the SCL mosaic's own grid
+   and weighted by the number of NDVI pixels each SCL pixel covers (4 for a 20 m SCL under a
+   10 m NDVI), instead of upsampling the SCL mosaic.
+3. **Histogram**: the NDVI histogram shown in the application is accumulated in the same pass.
+4. **Quantiles**: the median (and any other percentile) comes from a quantile sketch, a fine
+   histogram of NDVI on a fixed grid of QUANTILE_STEP, instead of sorting every pixel
+   (see sketch_quantiles for the error bound). Sketches of blocks, dates or processes merge by
+   adding their counts, so they can be computed in parallel.
+
+NDVI mosaics stored as scaled int16 (see NDVI_INT16 in main.py) are decoded with their band
+scale, offset and nodata, so float32 and int16 mosaics give the same statistics.
+
+The same accumulator (empty_accumulator, add_ndvi_block, add_scl_block, finish_summary) is fed
+by main.py while it writes the mosaic blocks, which saves the result as a summary.json sidecar
+next to the mosaics. build_analytics updates the analytics store read by the application (see
+analytics_store) and the ndvi_data.csv table incrementally: only the dates whose mosaics changed
+since their row was stored are summarized, from their sidecar when it is current, otherwise by
+reading their mosaics once on a process pool. store_date upserts a single date into the store as
+soon as main.py has written its mosaics, so the application sees the date without a rebuild.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime as dt
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from analytics_store import (SCHEMA, STORE_FILE, open_store, source_mtimes, summaries_to_table,
+                             upsert, write_store)
+
+# SCL classes of cloud shadows, clouds, thin cirrus and snow, counted as masked pixels
+CLOUD_VALUES = [3, 8, 9, 10, 11]
+
+# SCL class of vegetation pixels
+VEGETATION_CLASS = 4
+
+# NDVI histogram shown in the application
+HIST_RANGE = (0.2, 1)
+HIST_BINS = 25
+
+# Grid of the quantile sketch: NDVI from -1 to 1 in steps of 1e-4, the precision of NDVI_INT16
+QUANTILE_RANGE = (-1.0, 1.0)
+QUANTILE_STEP = 1e-4
+QUANTILE_BINS = int(round((QUANTILE_RANGE[1] - QUANTILE_RANGE[0]) / QUANTILE_STEP)) + 1
+
+# Sidecar record written next to the mosaics of each date by main.py
+SUMMARY_FILE = "summary.json"
+
+# Columns of the NDVI table, in order
+COLUMNS = [
+    "date", "total_pixels", "veg_pixels", "masked_pixels",
+    "cloud_cover_pct", "veg_abundance_pct", "avg_ndvi",
+    "median_ndvi", "std_ndvi", "var_coeff_ndvi"
+]
+
+
+def block_windows(width, height, block_size):
+    """
+    Yields the windows that tile a width x height raster in blocks of block_size pixels.
+    """
+    for row in range(0, height, block_size):
+        for col in range(0, width, block_size):
+            yield Window(col, row, min(block_size, width - col), min(block_size, height - row))
+
+
+def read_ndvi(src, window=None):
+    """
+    Reads NDVI values from an open NDVI raster, decoding a scaled-integer encoding with the
+    band's scale and offset. Nodata pixels are returned as NaN.
+    """
+    data = src.read(1, window=window, masked=True).astype('float64')
+    return (data * src.scales[0] + src.offsets[0]).filled(np.nan)
+
+
+def empty_moments():
+    """
+    Returns the running moments of an empty set of values: count, mean and the sum of
+    squared deviations from the mean (m2).
+    """
+    return {"count": 0, "mean": 0.0, "m2": 0.0}
+
+
+def merge_moments(a, b):
+    """
+    Combines the moments of two disjoint sets of values (Chan et al.'s parallel algorithm).
+    """
+    count = a["count"] + b["count"]
+    if count == 0:
+        return empty_moments()
+    delta = b["mean"] - a["mean"]
+    mean = a["mean"] + delta * b["count"] / count
+    m2 = a["m2"] + b["m2"] + delta ** 2 * a["count"] * b["count"] / count
+    return {"count": count, "mean": mean, "m2": m2}
+
+
+def block_moments(values):
+    """
+    Returns the moments of the finite values of a block.
+    """
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return empty_moments()
+    mean = values.mean()
+    return {"count": int(values.size), "mean": float(mean),
+            "m2": float(((values - mean) ** 2).sum())}
+
+
+def scl_class_counts(scl_block):
+    """
+    Counts the pixels of each SCL class (0-255) in a block, ignoring NaN pixels.
+    """
+    classes = scl_block[~np.isnan(scl_block)].astype(np.int64)
+    return np.bincount(classes, minlength=256)
+
+
+def pixel_weight(ndvi_src, scl_src):
+    """
+    Returns how many NDVI pixels one SCL pixel covers, from the two mosaics' transforms,
+    e.g. 4 for a 20 m SCL mosaic under a 10 m NDVI mosaic. Whole ratios are returned as int.
+    """
+    weight = (abs(scl_src.transform.a / ndvi_src.transform.a)
+              * abs(scl_src.transform.e / ndvi_src.transform.e))
+    return int(round(weight)) if np.isclose(weight, round(weight)) else weight
+
+
+def summarize_scl(class_counts, weight=1, cloud_values=CLOUD_VALUES):
+    """
+    Turns SCL class counts into the pixel counts and percentages of the NDVI table, with every
+    count expressed in NDVI pixels.
+
+    Parameters:
+    class_counts (numpy.ndarray): Pixel counts per SCL class from scl_class_counts.
+    weight (int or float): The NDVI pixels covered by one SCL pixel (see pixel_weight).
+    cloud_values (list): List of SCL values representing clouds, snow, or shadows.
+
+    Returns:
+    dict: total_pixels, veg_pixels, masked_pixels, cloud_cover_pct and veg_abundance_pct.
+    """
+    total_pixels = class_counts.sum() * weight
+    veg_pixels = class_counts[VEGETATION_CLASS] * weight
+    masked_pixels = class_counts[cloud_values].sum() * weight
+    clear_pixels = total_pixels - masked_pixels
+    return {
+        "total_pixels": total_pixels,
+        "veg_pixels": veg_pixels,
+        "masked_pixels": masked_pixels,
+        "cloud_cover_pct": masked_pixels / total_pixels * 100 if total_pixels else np.nan,
+        "veg_abundance_pct": veg_pixels / clear_pixels * 100 if clear_pixels else np.nan,
+    }
+
+
+def histogram_percentiles(counts, percentiles):
+    """
+    Computes percentiles from a histogram of unit-width bins starting at 0 (bin i counts the
+    value i). For integer-valued data this matches np.percentile's default linear interpolation
+    exactly, without holding the pixels in memory.
+
+    Parameters:
+    counts (numpy.ndarray): The histogram counts.
+    percentiles (list): The percentiles to compute, between 0 and 100.
+
+    Returns:
+    list: The value at each percentile.
+    """
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    if total == 0:
+        raise ValueError("No valid pixels to compute percentiles from.")
+
+    values = []
+    for percentile in percentiles:
+        rank = percentile / 100 * (total - 1)
+        lower = np.searchsorted(cumulative, np.floor(rank), side='right')
+        upper = np.searchsorted(cumulative, np.ceil(rank), side='right')
+        values.append(lower + (upper - lower) * (rank - np.floor(rank)))
+    return values
+
+
+def empty_sketch():
+    """
+    Returns an empty quantile sketch: one count per point of the NDVI grid
+    (QUANTILE_BINS int64 counts, about 160 KB).
+    """
+    return np.zeros(QUANTILE_BINS, dtype=np.int64)
+
+
+def sketch_block(values):
+    """
+    Returns the quantile sketch of the finite values of a block: each value is rounded to the
+    nearest point of the grid and counted there. Values outside QUANTILE_RANGE (impossible for
+    NDVI) are counted at the nearest end of the grid.
+    """
+    values = values[np.isfinite(values)]
+    # floor(x + 0.5) rounds to the nearest grid point and, like any rounding, keeps the order
+    index = (values - QUANTILE_RANGE[0]) * (1 / QUANTILE_STEP) + 0.5
+    np.clip(index, 0, QUANTILE_BINS - 1, out=index)
+    return np.bincount(index.astype(np.intp), minlength=QUANTILE_BINS)
+
+
+def merge_sketches(*sketches):
+    """
+    Merges quantile sketches of disjoint sets of values, e.g. of several blocks or dates.
+    The merged sketch is exactly the sketch of all the values together.
+    """
+    return np.sum(sketches, axis=0)
+
+
+def sketch_quantiles(sketch, percentiles):
+    """
+    Computes percentiles from a quantile sketch, with np.percentile's linear interpolation
+    between the sketched values.
+
+    Error bound: rounding to the grid never reorders values, so every order statistic of the
+    sketch is the original order statistic rounded to the grid, within QUANTILE_STEP / 2, and
+    so is any interpolation between two of them. Every percentile is therefore within
+    QUANTILE_STEP / 2 (5e-5) of the exact np.percentile, whatever the number of pixels, and
+    exact for NDVI_INT16 mosaics, whose values already lie on the grid.
+
+    Parameters:
+    sketch (numpy.ndarray): A sketch from sketch_block or merge_sketches.
+    percentiles (list): The percentiles to compute, between 0 and 100.
+
+    Returns:
+    list: The NDVI value at each percentile, NaN for an empty sketch.
+    """
+    if sketch.sum() == 0:
+        return [np.nan] * len(percentiles)
+    return [QUANTILE_RANGE[0] + position * QUANTILE_STEP
+            for position in histogram_percentiles(sketch, percentiles)]
+
+
+def summarize_ndvi(moments, median):
+    """
+    Turns NDVI moments and median into the NDVI columns of the table.
+    """
+    if moments["count"] == 0:
+        avg = std = np.nan
+    else:
+        avg = moments["mean"]
+        std = np.sqrt(moments["m2"] / moments["count"])
+    return {
+        "avg_ndvi": avg,
+        "median_ndvi": median,
+        "std_ndvi": std,
+        "var_coeff_ndvi": std / avg if avg != 0 else np.nan,
+    }
+
+
+def empty_accumulator():
+    """
+    Returns empty running statistics of a date, to be filled block by block with add_ndvi_block
+    and add_scl_block while the mosaics are read or written.
+    """
+    return {
+        "moments": empty_moments(),
+        "sketch": empty_sketch(),
+        "histogram": np.zeros(HIST_BINS, dtype=np.int64),
+        "class_counts": np.zeros(256, dtype=np.int64),
+    }
+
+
+def add_ndvi_block(accumulator, ndvi):
+    """
+    Adds a block of NDVI values (NaN where missing) to the moments, quantile sketch and
+    histogram of an accumulator.
+    """
+    valid = ndvi[~np.isnan(ndvi)].astype('float64')
+    accumulator["moments"] = merge_moments(accumulator["moments"], block_moments(valid))
+    accumulator["sketch"] += sketch_block(valid)
+    accumulator["histogram"] += np.histogram(valid, bins=HIST_BINS, range=HIST_RANGE)[0]
+
+
+def add_scl_block(accumulator, scl):
+    """
+    Adds a block of SCL classes (NaN where missing) to the class counts of an accumulator.
+    """
+    accumulator["class_counts"] += scl_class_counts(scl)
+
+
+def finish_summary(accumulator, weight=1):
+    """
+    Turns an accumulator into the summary of a date.
+
+    Parameters:
+    accumulator (dict): The running statistics from empty_accumulator.
+    weight (int or float): The NDVI pixels covered by one SCL pixel (see pixel_weight).
+
+    Returns:
+    dict: "stats" with total_pixels, veg_pixels, masked_pixels, cloud_cover_pct,
+        veg_abundance_pct, avg_ndvi, median_ndvi, std_ndvi and var_coeff_ndvi, "histogram"
+        with the counts and bin edges of the NDVI histogram, and "scl_classes" with the
+        pixel count of every SCL class present.
+    """
+    median = sketch_quantiles(accumulator["sketch"], [50])[0]
+    class_counts = accumulator["class_counts"]
+    return {
+        "stats": {**summarize_scl(class_counts, weight),
+                  **summarize_ndvi(accumulator["moments"], median)},
+        "histogram": {"counts": accumulator["histogram"],
+                      "bins": np.histogram_bin_edges([], bins=HIST_BINS, range=HIST_RANGE)},
+        "scl_classes": {int(c): int(class_counts[c]) for c in np.flatnonzero(class_counts)},
+    }
+
+
+def date_summary(date_path, block_size=1024):
+    """
+    Computes the summary of a date (see finish_summary) from its NDVI_mosaic.tif and
+    SCL_mosaic.tif, reading each mosaic once, block by block.
+
+    Everything is accumulated in constant memory; the median comes from a quantile sketch and
+    is within 5e-5 of the exact median (exact for int16 mosaics, see sketch_quantiles).
+
+    Parameters:
+    date_path (str): The directory holding the date's mosaics.
+    block_size (int, optional): The width and height of the blocks in pixels. Defaults to 1024.
+
+    Returns:
+    dict: The summary of the date, as returned by finish_summary.
+    """
+    accumulator = empty_accumulator()
+
+    with rasterio.open(f"{date_path}/NDVI_mosaic.tif") as ndvi_src, \
+            rasterio.open(f"{date_path}/SCL_mosaic.tif") as scl_src:
+        for window in block_windows(ndvi_src.width, ndvi_src.height, block_size):
+            add_ndvi_block(accumulator, read_ndvi(ndvi_src, window))
+
+        for window in block_windows(scl_src.width, scl_src.height, block_size):
+            scl = scl_src.read(1, window=window, masked=True).astype('float32').filled(np.nan)
+            add_scl_block(accumulator, scl)
+
+        weight = pixel_weight(ndvi_src, scl_src)
+
+    return finish_summary(accumulator, weight)
+
+
+def save_summary(summary, date_path):
+    """
+    Writes the summary of a date to {date_path}/summary.json, next to its mosaics. The file is
+    replaced atomically, so a reader never sees a half-written record.
+
+    Returns:
+    str: The path of the sidecar.
+    """
+    record = {
+        "stats": {key: np.asarray(value).item() for key, value in summary["stats"].items()},
+        "histogram": {key: np.asarray(value).tolist()
+                      for key, value in summary["histogram"].items()},
+        "scl_classes": {str(c): n for c, n in summary["scl_classes"].items()},
+    }
+    path = f"{date_path}/{SUMMARY_FILE}"
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(record, f, indent=1)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def mosaics_mtime(date_path):
+    """
+    Returns the modification time of the newer of a date's NDVI and SCL mosaics,
+    or 0 if neither exists.
+    """
+    mosaics = [f"{date_path}/NDVI_mosaic.tif", f"{date_path}/SCL_mosaic.tif"]
+    return max((os.path.getmtime(m) for m in mosaics if os.path.exists(m)), default=0.0)
+
+
+def load_summary(date_path):
+    """
+    Loads the sidecar summary of a date, or returns None if it is missing or older than one
+    of the date's mosaics.
+    """
+    path = f"{date_path}/{SUMMARY_FILE}"
+    if not os.path.exists(path) or mosaics_mtime(date_path) > os.path.getmtime(path):
+        return None
+    with open(path) as f:
+        record = json.load(f)
+    return {
+        "stats": record["stats"],
+        "histogram": {"counts": np.array(record["histogram"]["counts"], dtype=np.int64),
+                      "bins": np.array(record["histogram"]["bins"])},
+        "scl_classes": {int(c): n for c, n in record["scl_classes"].items()},
+    }
+
+
+def read_summary(date_path, block_size=1024):
+    """
+    Returns the summary of a date from its sidecar when it is current, and otherwise computes
+    it from the mosaics (see date_summary). The summary's "source_mtime" is the modification
+    time of the mosaics it describes (see mosaics_mtime), taken before they are read.
+    """
+    source_mtime = mosaics_mtime(date_path)
+    summary = load_summary(date_path)
+    if summary is None:
+        summary = date_summary(date_path, block_size)
+    summary["source_mtime"] = source_mtime
+    return summary
+
+
+def date_stats(date_path, block_size=1024):
+    """
+    Returns the table statistics of a date (see date_summary).
+    """
+    return date_summary(date_path, block_size)["stats"]
+
+
+def find_dates(base_dir, year=2024):
+    """
+    Lists the date folders of the historic rasters, laid out as base_dir/{month name}/{day}.
+    Anything else in base_dir (.DS_Store, old histogram pickles, ...) is skipped.
+
+    Returns:
+    list: (date as YYYY-MM-DD, month name, day, folder path) for every date folder.
+    """
+    dates = []
+    for month in sorted(os.listdir(base_dir)):
+        try:
+            month_number = dt.strptime(month, "%B").month
+        except ValueError:
+            continue
+        for day in sorted(os.listdir(f"{base_dir}/{month}")):
+            date_path = f"{base_dir}/{month}/{day}"
+            if os.path.isdir(date_path):
+                dates.append((f"{year}-{month_number:02d}-{day}", month, day, date_path))
+    return dates
+
+
+def build_summaries(dates, max_workers=None):
+    """
+    Runs read_summary for every date on a process pool. Dates with a current summary.json
+    sidecar are not read again; the others have their mosaics read once, several dates at
+    the same time. A date that fails is reported and skipped.
+
+    Parameters:
+    dates (list): (date, month name, day, folder path) of each date, as given by find_dates.
+    max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+    list: (date, month name, day, folder path, summary) for every date, sorted by date.
+    """
+    summaries = []
+    if not dates:
+        return summaries
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(read_summary, date[3]): date for date in dates}
+        for future in as_completed(futures):
+            date = futures[future]
+            try:
+                summaries.append((*date, future.result()))
+            except Exception as e:
+                print(f"Error processing {date[3]}: {e}")
+    return sorted(summaries)
+
+
+# Serializes the updates of the store by the pipeline's date threads (see store_date)
+_STORE_LOCK = threading.Lock()
+
+
+def stored_rows(store_path=STORE_FILE):
+    """
+    Returns the rows of the store at store_path and their source_mtime by date (see
+    analytics_store.source_mtimes). A missing store, or one written with an older SCHEMA,
+    gives an empty table, so it is rebuilt.
+    """
+    if os.path.exists(store_path):
+        store = open_store(store_path)
+        if store["table"].schema.equals(SCHEMA):
+            return store["table"], source_mtimes(store)
+        print(f"{store_path} was written by an older version, rebuilding it")
+    return SCHEMA.empty_table(), {}
+
+
+def store_date(date, date_path, store_path=STORE_FILE):
+    """
+    Upserts the summary of one date into the analytics store, from its sidecar when it is
+    current (see read_summary). Called by main.py once a date's mosaics are written; the
+    dates processed at once are written to the store one at a time. The ndvi_data.csv
+    table is only written by build_analytics.
+
+    Parameters:
+    date (str): The date as YYYY-MM-DD.
+    date_path (str): The folder of the date's mosaics.
+    store_path (str, optional): Path of the analytics store. Defaults to STORE_FILE.
+    """
+    updates = summaries_to_table([(date, read_summary(date_path))])
+    with _STORE_LOCK:
+        table, _ = stored_rows(store_path)
+        write_store(upsert(table, updates), store_path)
+    return store_path
+
+
+def build_analytics(base_dir, csv_path="ndvi_data.csv", store_path=STORE_FILE, max_workers=None,
+                    year=2024, rebuild=False):
+    """
+    Brings the analytics of the application up to date with the archive: the analytics store
+    read by the application (see analytics_store), with the histogram and statistics of every
+    date, and the NDVI table saved to csv_path.
+
+    Only the dates that are not in the store yet, or whose NDVI or SCL mosaic is newer than
+    their row, are summarized (in one parallel scan, see build_summaries). Their rows are then
+    upserted into the store in one batch, so adding a day to the archive reads that day's
+    mosaics only. Dates whose folder is no longer in base_dir keep their row.
+
+    Parameters:
+    base_dir (str): The directory holding the month folders of the historic rasters.
+    csv_path (str, optional): Where the NDVI table is saved. Defaults to "ndvi_data.csv".
+    store_path (str, optional): Where the analytics store is saved. Defaults to STORE_FILE.
+    max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+    year (int, optional): The year of the rasters. Defaults to 2024.
+    rebuild (bool, optional): Ignore the existing store and summarize every date in base_dir.
+
+    Returns:
+    pandas.DataFrame: The NDVI table, one row per date sorted by date.
+    """
+    table, stored = SCHEMA.empty_table(), {}
+    if not rebuild:
+        table, stored = stored_rows(store_path)
+
+    stale = [date for date in find_dates(base_dir, year)
+             if mosaics_mtime(date[3]) > stored.get(date[0], -np.inf)]
+    summaries = build_summaries(stale, max_workers)
+    updates = summaries_to_table([(date, summary) for date, *_, summary in summaries])
+    table = upsert(table, updates)
+    write_store(table, store_path)
+    print(f"Updated {len(summaries)} of {table.num_rows} dates in {store_path}")
+
+    df = table.select(COLUMNS).to_pandas(date_as_object=False)
+    df.to_csv(csv_path, index=False)
+    print(f"Saved {len(df)} dates to {csv_path}")
+    return df
@@ -0,0 +1,163 @@
+"""
+This module keeps a JSON manifest of everything the pipeline in main.py has written, so that
+re-running a season only recomputes what changed.
+
+The manifest records:
+1. **files**: the size and SHA-256 checksum of every output raster.
+2. **scenes**: for each processed scene, its inputs (STAC item id, asset hrefs, pipeline version
+   and processing options) and the files it produced. A scene whose inputs are unchanged and
+   whose outputs are still on disk is skipped.
+3. **products**: for each mosaic, RGB composite or other derived raster, the checksums of the
+   files it was built from. A product is rebuilt only when one of its inputs changed.
+
+The manifest is shared by the scene and date worker threads, so every change goes through a lock.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+_MANIFEST_LOCK = threading.Lock()
+
+
+def load_manifest(manifest_path):
+    """
+    Loads the manifest from manifest_path, or returns an empty one if it doesn't exist yet.
+
+    Parameters:
+    manifest_path (str): Path of the manifest JSON file.
+
+    Returns:
+    dict: The manifest with "files", "scenes" and "products" entries.
+    """
+    manifest = {"path": manifest_path, "files": {}, "scenes": {}, "products": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest.update(json.load(f))
+    return manifest
+
+
+def save_manifest(manifest):
+    """
+    Writes the manifest back to its path. The file is replaced atomically, so an
+    interrupted run never leaves a half-written manifest behind.
+    """
+    with _MANIFEST_LOCK:
+        data = {key: manifest[key] for key in ("files", "scenes", "products")}
+        os.makedirs(os.path.dirname(manifest["path"]) or ".", exist_ok=True)
+        with open(f"{manifest['path']}.tmp", "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(f"{manifest['path']}.tmp", manifest["path"])
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 checksum of a file, read in chunks of chunk_size bytes.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(inputs):
+    # Round-trip through JSON so tuples and numpy floats compare equal to the stored values
+    return json.loads(json.dumps(inputs, sort_keys=True))
+
+
+def _file_is_current(manifest, path):
+    record = manifest["files"].get(path)
+    return (record is not None and os.path.exists(path)
+            and os.path.getsize(path) == record["size"])
+
+
+def record_files(manifest, paths):
+    """
+    Records the size and checksum of each file in paths.
+    """
+    records = {path: {"size": os.path.getsize(path), "sha256": file_checksum(path)}
+               for path in paths}
+    with _MANIFEST_LOCK:
+        manifest["files"].update(records)
+
+
+def scene_is_current(manifest, scene_key, inputs):
+    """
+    Checks whether a scene was already processed with the same inputs and its outputs
+    are still on disk with their recorded size.
+
+    Parameters:
+    manifest (dict): The manifest returned by load_manifest.
+    scene_key (str): A key unique to the scene's output, e.g. "{output_path}/{scene.id}".
+    inputs (dict): The scene's inputs: STAC item id, asset hrefs, pipeline version and options.
+
+    Returns:
+    bool: True if the scene can be skipped.
+    """
+    with _MANIFEST_LOCK:
+        record = manifest["scenes"].get(scene_key)
+        return (record is not None and record["inputs"] == _normalize(inputs)
+                and all(_file_is_current(manifest, path) for path in record["outputs"]))
+
+
+def record_scene(manifest, scene_key, inputs, output_files):
+    """
+    Records a processed scene's inputs and outputs, including the outputs' checksums.
+
+    Parameters:
+    manifest (dict): The manifest returned by load_manifest.
+    scene_key (str): A key unique to the scene's output, e.g. "{output_path}/{scene.id}".
+    inputs (dict): The scene's inputs: STAC item id, asset hrefs, pipeline version and options.
+    output_files (list): Paths of the rasters written for the scene.
+    """
+    record_files(manifest, output_files)
+    with _MANIFEST_LOCK:
+        manifest["scenes"][scene_key] = {"inputs": _normalize(inputs),
+                                         "outputs": sorted(output_files)}
+
+
+def product_is_current(manifest, output_file, input_files, options=None):
+    """
+    Checks whether a derived raster (mosaic, RGB composite, ...) was built from exactly
+    the current input files, going by their recorded checksums, and is still on disk.
+
+    Parameters:
+    manifest (dict): The manifest returned by load_manifest.
+    output_file (str): Path of the derived raster.
+    input_files (list): Paths of the rasters it is built from.
+    options (dict, optional): Settings that change the product, such as the pipeline version.
+
+    Returns:
+    bool: True if the product doesn't need to be rebuilt.
+    """
+    with _MANIFEST_LOCK:
+        record = manifest["products"].get(output_file)
+        if record is None or not _file_is_current(manifest, output_file):
+            return False
+        if record.get("options") != _normalize(options):
+            return False
+        if not all(_file_is_current(manifest, path) for path in input_files):
+            return False
+        current = {path: manifest["files"][path]["sha256"] for path in input_files}
+        return record["inputs"] == current
+
+
+def record_product(manifest, output_file, input_files, options=None):
+    """
+    Records a derived raster together with the checksums of the files it was built from.
+    The input files must already be recorded (see record_scene and record_files).
+
+    Parameters:
+    manifest (dict): The manifest returned by load_manifest.
+    output_file (str): Path of the derived raster.
+    input_files (list): Paths of the rasters it is built from.
+    options (dict, optional): Settings that change the product, such as the pipeline version.
+    """
+    record_files(manifest, [output_file])
+    with _MANIFEST_LOCK:
+        manifest["products"][output_file] = {
+            "inputs": {path: manifest["files"][path]["sha256"] for path in input_files},
+            "options": _normalize(options),
+        }
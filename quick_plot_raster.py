@@ -8,7 +8,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from rasterio.io import MemoryFile
-from upload_to_DO import connect_s3_client
+from upload_to_DO import get_s3_client
 
 # Function to apply a percentile-based contrast stretch
 def contrast_stretch(band, lower_percentile=2, upper_percentile=98):
@@ -79,7 +79,7 @@ with rasterio.open(ndvi_raster_path) as src:
 
 OBJECT_KEY = "montana/2024/07/26/RGB-missoula-2024-07-26.tif"
 
-s3_client, BUCKET_NAME = connect_s3_client()
+s3_client, BUCKET_NAME = get_s3_client()
 response = s3_client.get_object(Bucket=BUCKET_NAME, Key=OBJECT_KEY)
 file_data = response["Body"].read()  # Read file into memory
 
@@ -130,7 +130,9 @@ with rasterio.open(ndvi_raster_path, "r+") as src:
 ### Code for producing a histogram of NDVI distribution
 ndvi_raster_path = '/Volumes/Drew_ext_drive/NDVI_Proj/historic_rasters/2024/April/22/NDVI_mosaic.tif'
 with rasterio.open(ndvi_raster_path) as src:
-    ndvi_data = src.read(1)
+    # Decode the scaled int16 mosaic with the band's scale and offset, nodata as NaN
+    ndvi_data = src.read(1, masked=True).astype('float64')
+    ndvi_data = (ndvi_data * src.scales[0] + src.offsets[0]).filled(np.nan)
     plt.hist(ndvi_data[~np.isnan(ndvi_data)], bins=20, alpha=0.5, label='NDVI Values', range=(0.2, 1))
     plt.title('Histogram of NDVI Values')
     plt.xlabel('NDVI Value')
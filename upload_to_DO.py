@@ -2,48 +2,126 @@
 This script provides functionality to connect to a DigitalOcean Spaces S3-compatible storage service 
 and upload raster images to a specified bucket.
 
-1. **connect_s3_client()**: This function loads AWS credentials and configuration from environment variables 
-   and establishes a connection to the S3 client using the `boto3` library. It returns the client object 
-   and the bucket name for further operations.
+1. **get_s3_client()**: This function loads AWS credentials and configuration from environment variables 
+   and returns a process-wide S3 client built with the `boto3` library, together with the bucket name.
+   The client is created once, with a connection pool, keep-alive and retry policy, and is shared by the
+   pipeline, the uploader and the read tools, including their worker threads. **connect_s3_client()** is
+   kept as a thin wrapper around it.
 
 2. **upload_image_to_s3()**: This function takes the S3 client, bucket name, local file path of the raster image, 
    and the date as parameters. It constructs the S3 object key based on the provided date and raster layer type, 
    and uploads the image to the specified S3 bucket. The upload is done with public-read access by default.
 
+3. **upload_products()**: This function uploads all the products of a date (e.g. the RGB and NDVI mosaics)
+   concurrently, with multipart transfers tuned by TRANSFER_CONFIG. Objects whose size and ETag already match
+   the local file are skipped, and a result is returned for every file instead of printing errors.
+
+4. **start_publisher()**, **publish()** and **flush_publisher()**: A background publish stage. Finished products
+   are queued with publish() and uploaded by background workers while the pipeline moves on to the next date;
+   flush_publisher() waits for the queue to drain at the end of the run and returns a report.
+
 
 These functions can be optionally included in the main.py script to handle the upload of raster images to the
 DigitalOcean Spaces bucket.
 """
 
+import hashlib
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
 import boto3.session
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 from dotenv import load_dotenv
 
+MB = 1024 ** 2
+
+# Multipart settings for the mosaics: parts of 16 MB, up to 8 parts of a file in flight at once
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * MB,
+    multipart_chunksize=16 * MB,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+
+# Clients created by get_s3_client, keyed by their connection settings
+_S3_CLIENTS = {}
+_S3_CLIENTS_LOCK = threading.Lock()
+
+
+def get_s3_client(max_pool_connections=32, max_attempts=5, retry_mode="standard",
+                  tcp_keepalive=True):
+    """
+    Returns the process-wide S3 client and the bucket name. The client is created on the
+    first call and reused afterwards, so a run opens one session and keeps its TLS
+    connections alive instead of handshaking again for every date. boto3 clients are
+    thread-safe, so worker threads can share it.
+
+    Parameters:
+    - max_pool_connections: The size of the connection pool. It should cover the uploads in
+      flight, e.g. upload_products' max_workers times TRANSFER_CONFIG.max_concurrency. Defaults to 32.
+    - max_attempts: The number of attempts per request, including the first. Defaults to 5.
+    - retry_mode: The botocore retry mode, "standard" or "adaptive". Defaults to "standard".
+    - tcp_keepalive: Keep idle connections alive between requests. Defaults to True.
+    Calls with the same settings share one client.
+    """
+    settings = (max_pool_connections, max_attempts, retry_mode, tcp_keepalive)
+    with _S3_CLIENTS_LOCK:
+        if settings not in _S3_CLIENTS:
+            # Load environment variables from .env file
+            load_dotenv()
+
+            # Get secrets from environment
+            ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
+            SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+            REGION = os.getenv("SPACES_REGION")
+            BUCKET_NAME = os.getenv("SPACES_BUCKET_NAME")
+            ENDPOINT_URL = os.getenv("SPACES_ENDPOINT_URL",
+                                     "https://sfo3.digitaloceanspaces.com")
+
+            config = Config(max_pool_connections=max_pool_connections,
+                            retries={"total_max_attempts": max_attempts, "mode": retry_mode},
+                            tcp_keepalive=tcp_keepalive)
+            session = boto3.session.Session()
+            client = session.client('s3',
+                                    region_name=REGION,
+                                    endpoint_url=ENDPOINT_URL,
+                                    aws_access_key_id=ACCESS_KEY,
+                                    aws_secret_access_key=SECRET_KEY,
+                                    config=config)
+            _S3_CLIENTS[settings] = (client, BUCKET_NAME)
+        return _S3_CLIENTS[settings]
+
 
 def connect_s3_client():
-    # Load environment variables from .env file
-    load_dotenv()
-
-    # Get secrets from environment
-    ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
-    SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-    REGION = os.getenv("SPACES_REGION")
-    BUCKET_NAME = os.getenv("SPACES_BUCKET_NAME")
-
-    session = boto3.session.Session()
-    client = session.client('s3',
-                            region_name=REGION,
-                            endpoint_url='https://sfo3.digitaloceanspaces.com',
-                            aws_access_key_id=ACCESS_KEY,
-                            aws_secret_access_key=SECRET_KEY)
-    return client, BUCKET_NAME
+    """
+    Returns the shared S3 client and the bucket name from get_s3_client.
+    """
+    return get_s3_client()
 
 # client, BUCKET_NAME = connect_s3_client()
 
 
-def upload_image_to_s3(client, BUCKET_NAME, path_to_raster, date):
+def object_key(path_to_raster, date, region="missoula"):
+    """
+    Returns the key of a raster in the bucket: montana/{region}/{date}/{layer}.tif,
+    where layer is the raster's file name up to the first underscore (e.g. RGB, NDVI).
+    Missoula county is hard coded for now.
+    """
+    # Collect raster layer type
+    raster_name = path_to_raster.split("/")[-1]
+    layer = raster_name.split("_")[0]
+    return f"montana/{region}/{date}/{layer}.tif"
+
+
+def upload_image_to_s3(client, BUCKET_NAME, path_to_raster, date, config=TRANSFER_CONFIG):
     """
     Uploads a raster image to a specified S3 bucket.
 
@@ -52,16 +130,10 @@ def upload_image_to_s3(client, BUCKET_NAME, path_to_raster, date):
     - BUCKET_NAME: The name of the S3 bucket.
     - path_to_raster: The local path to the raster image file.
     - date: The date of the raster image in YYYY-MM-DD format.
+    - config: The multipart transfer settings. Defaults to TRANSFER_CONFIG.
     """
-    region = "missoula"  # Missoula county is hard coded for now
-
-    # Collect raster layer type
-    raster_name = path_to_raster.split("/")[-1]
-    layer = raster_name.split("_")[0]
-
     # Set the destination in the bucket
-    # Destination in bucket
-    S3_OBJECT_KEY = f"montana/{region}/{date}/{layer}.tif"
+    S3_OBJECT_KEY = object_key(path_to_raster, date)
 
     # Upload the file
     try:
@@ -70,13 +142,187 @@ def upload_image_to_s3(client, BUCKET_NAME, path_to_raster, date):
             Bucket=BUCKET_NAME,
             Key=S3_OBJECT_KEY,
             # Keep it private unless public access is needed
-            ExtraArgs={'ACL': 'public-read', 'ContentType': 'image/tiff'}
+            ExtraArgs={'ACL': 'public-read', 'ContentType': 'image/tiff'},
+            Config=config
         )
         print(f"Successfully uploaded {S3_OBJECT_KEY}")
     except Exception as e:
         print(f"Error uploading {S3_OBJECT_KEY}: {e}")
 
 
+def multipart_etag(path, config=TRANSFER_CONFIG):
+    """
+    Computes the ETag S3 gives a file uploaded with config: the MD5 of the file when it is
+    below the multipart threshold, otherwise the MD5 of the parts' MD5s followed by
+    "-{number of parts}".
+
+    Parameters:
+    - path: The local path of the file.
+    - config: The transfer settings the file is uploaded with.
+    """
+    if os.path.getsize(path) < config.multipart_threshold:
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(MB), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    part_digests = []
+    with open(path, "rb") as f:
+        for part in iter(lambda: f.read(config.multipart_chunksize), b""):
+            part_digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def object_is_current(client, BUCKET_NAME, key, path_to_raster, config=TRANSFER_CONFIG):
+    """
+    Checks whether the object at key already holds path_to_raster, going by its size and ETag.
+    Returns False when the object doesn't exist.
+    """
+    try:
+        head = client.head_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return (head["ContentLength"] == os.path.getsize(path_to_raster)
+            and head["ETag"].strip('"') == multipart_etag(path_to_raster, config))
+
+
+def upload_products(client, BUCKET_NAME, paths, date, max_workers=4, config=TRANSFER_CONFIG,
+                    skip_existing=True):
+    """
+    Uploads several rasters of a date concurrently. Each file is uploaded in parts with config,
+    and up to max_workers files are uploaded at once. Files already in the bucket with the
+    same size and ETag are skipped. Errors don't stop the other uploads; they are reported in
+    the results.
+
+    Parameters:
+    - client: The S3 client object. boto3 clients are thread-safe and are shared by the workers.
+    - BUCKET_NAME: The name of the S3 bucket.
+    - paths: The local paths of the rasters, e.g. the RGB and NDVI mosaics of the date.
+    - date: The date of the rasters in YYYY-MM-DD format.
+    - max_workers: The number of files uploaded at once. Defaults to 4.
+    - config: The multipart transfer settings. Defaults to TRANSFER_CONFIG.
+    - skip_existing: Skip files that are already uploaded. Defaults to True.
+
+    Returns:
+    - A list with one dict per file: path, key, status ("uploaded", "skipped" or "failed"),
+      bytes, seconds and error (None unless the upload failed).
+    """
+    def upload(path):
+        key = object_key(path, date)
+        result = {"path": path, "key": key, "status": "uploaded",
+                  "bytes": 0, "seconds": 0.0, "error": None}
+        start = time.perf_counter()
+        try:
+            result["bytes"] = os.path.getsize(path)
+            if skip_existing and object_is_current(client, BUCKET_NAME, key, path, config):
+                result["status"] = "skipped"
+            else:
+                client.upload_file(
+                    Filename=path,
+                    Bucket=BUCKET_NAME,
+                    Key=key,
+                    ExtraArgs={'ACL': 'public-read', 'ContentType': 'image/tiff'},
+                    Config=config
+                )
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(upload, paths))
+
+
+def start_publisher(client, BUCKET_NAME, max_pending=4, upload_workers=2, max_workers=4,
+                    config=TRANSFER_CONFIG):
+    """
+    Starts a background publish stage: a bounded queue of dates served by upload_workers
+    threads, each uploading one date's products with upload_products.
+
+    Parameters:
+    - client: The S3 client object, e.g. from get_s3_client.
+    - BUCKET_NAME: The name of the S3 bucket.
+    - max_pending: The most dates queued or uploading at once. publish() blocks when the queue
+      is full, so uploads that fall behind slow the pipeline down instead of piling up. Defaults to 4.
+    - upload_workers: The number of dates uploaded at once. Defaults to 2.
+    - max_workers: The number of files of a date uploaded at once. Defaults to 4.
+    - config: The multipart transfer settings. Defaults to TRANSFER_CONFIG.
+
+    Returns:
+    - The publisher, to pass to publish() and flush_publisher().
+    """
+    return {"client": client, "bucket": BUCKET_NAME, "max_workers": max_workers,
+            "config": config, "slots": threading.BoundedSemaphore(max_pending),
+            "executor": ThreadPoolExecutor(max_workers=upload_workers,
+                                           thread_name_prefix="publish"),
+            "futures": [], "start": time.perf_counter()}
+
+
+def publish(publisher, paths, date):
+    """
+    Queues the products of a date for upload and returns right away, unless max_pending
+    dates are already waiting, in which case it waits for a free slot.
+
+    Parameters:
+    - publisher: A publisher from start_publisher.
+    - paths: The local paths of the products, e.g. the RGB and NDVI mosaics of the date.
+    - date: The date of the products in YYYY-MM-DD format.
+
+    Returns:
+    - A future that resolves to the upload_products results.
+    """
+    publisher["slots"].acquire()
+
+    def run():
+        try:
+            return upload_products(publisher["client"], publisher["bucket"], paths, date,
+                                   publisher["max_workers"], publisher["config"])
+        finally:
+            publisher["slots"].release()
+
+    future = publisher["executor"].submit(run)
+    publisher["futures"].append((date, future))
+    return future
+
+
+def flush_publisher(publisher):
+    """
+    Waits for every queued upload to finish, stops the workers and prints a summary.
+
+    Parameters:
+    - publisher: A publisher from start_publisher.
+
+    Returns:
+    - A report with the number of uploaded, skipped and failed files, the bytes uploaded,
+      the seconds since the publisher started, and the per-file results (with their date).
+    """
+    results = []
+    for date, future in publisher["futures"]:
+        try:
+            date_results = future.result()
+        except Exception as e:
+            date_results = [{"path": None, "key": None, "status": "failed",
+                             "bytes": 0, "seconds": 0.0, "error": str(e)}]
+        results += [dict(result, date=date) for result in date_results]
+    publisher["executor"].shutdown()
+
+    statuses = Counter(result["status"] for result in results)
+    report = {"uploaded": statuses["uploaded"], "skipped": statuses["skipped"],
+              "failed": statuses["failed"],
+              "bytes": sum(r["bytes"] for r in results if r["status"] == "uploaded"),
+              "seconds": time.perf_counter() - publisher["start"], "results": results}
+
+    print(f"Published {report['uploaded']} files ({report['bytes'] / MB:.1f} MB), "
+          f"skipped {report['skipped']} already uploaded, {report['failed']} failed")
+    for result in results:
+        if result["status"] == "failed":
+            print(f"  {result['date']} {result['key']}: {result['error']}")
+    return report
+
+
 ### Example usage ###
 # local_file_path = '/Volumes/Drew_ext_drive/NDVI_Proj/historic_rasters/2024/July/26/RGB_mosaic.tif'
 # S3_OBJECT_KEY = f"montana/2024/07/28/RGB-missoula-2024-01-.tif"  # Destination in bucket